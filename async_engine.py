@@ -0,0 +1,121 @@
+import asyncio
+import itertools
+import threading
+
+import httpx
+from PySide6.QtCore import QObject, Signal
+
+from util.tracing import activeTrace, span
+
+
+class AsyncQueryEngine(QObject):
+    """The AsyncQueryEngine class runs chat requests as coroutines on one asyncio event loop kept on a single background thread, instead of one QThread per message. Streamed deltas, summaries and results come back to the UI as Qt signals tagged with the request id, a semaphore bounds how many requests run at once, and any request can be cancelled."""
+    delta = Signal(int, str)
+    summary_updated = Signal(int, dict)
+    finished = Signal(int, str)
+    cancelled = Signal(int)
+    closed = Signal()  # Emitted on the UI thread once the loop has drained and stopped
+    shutdown_finished = Signal()
+
+    def __init__(self, query_handler, max_concurrent_requests=8, parent=None):
+        super().__init__(parent)
+        self.query_handler = query_handler
+        self.request_ids = itertools.count(1)
+        self.requests = {}  # Futures of the requests in flight, keyed by request id
+
+        # One loop serves every request; signals emitted from it are queued to the UI thread
+        self.loop = asyncio.new_event_loop()
+        self.loop_thread = threading.Thread(target=self.runLoop, name="AsyncQueryEngine", daemon=True)
+        self.loop_thread.start()
+        self.shutdown_future = None
+
+        # Queued to the thread the engine was created on, so closed is emitted there
+        self.shutdown_finished.connect(self.onShutdownFinished)
+
+        # Requests beyond the limit wait on the loop rather than starting more HTTP calls
+        self.request_slots = asyncio.run_coroutine_threadsafe(self.createSemaphore(max_concurrent_requests), self.loop).result()
+
+    def runLoop(self):
+        self.loop.run_forever()
+        self.loop.close()
+
+    async def createSemaphore(self, limit):
+        return asyncio.Semaphore(limit)
+
+    def submit(self, query, session_messages, session_summary=None, trace=None):
+        # Schedule the request on the loop and return its id; results arrive through the signals
+        request_id = next(self.request_ids)
+        future = asyncio.run_coroutine_threadsafe(
+            self.runRequest(request_id, query, session_messages, session_summary, trace), self.loop
+        )
+        self.requests[request_id] = future
+        future.add_done_callback(lambda future, request_id=request_id: self.onRequestDone(request_id, future))
+        return request_id
+
+    def onRequestDone(self, request_id, future):
+        # Runs on whichever thread completed or cancelled the future
+        self.requests.pop(request_id, None)
+        if future.cancelled():
+            self.cancelled.emit(request_id)
+
+    def cancel(self, request_id):
+        # Cancelling the future cancels the task on the loop, closing its HTTP stream
+        if future := self.requests.get(request_id):
+            future.cancel()
+
+    async def runRequest(self, request_id, query, session_messages, session_summary, trace):
+        # Each request runs in its own task, so its trace stays separate from the others on the loop
+        with activeTrace(trace), span("AsyncQueryEngine request"):
+            try:
+                with span("wait for request slot"):
+                    await self.request_slots.acquire()
+                try:
+                    response_data = await self.query_handler.ahandleQuery(
+                        query=query,
+                        session_messages=session_messages,
+                        on_delta=lambda delta: self.delta.emit(request_id, delta),
+                        session_summary=session_summary,
+                        on_summary=lambda summary: self.summary_updated.emit(request_id, summary)
+                    )
+                finally:
+                    self.request_slots.release()
+            except Exception as e:
+                # Report the failure in the chat, as the worker thread did
+                self.finished.emit(request_id, f"Error processing the response: {e}")
+                return
+
+        # Check if the response contains valid data
+        if not response_data.get('choices'):
+            self.finished.emit(request_id, "I'm sorry, I couldn't process that request.")
+            return
+
+        # Extract and emit the bot's response
+        self.finished.emit(request_id, response_data['choices'][0].get('message', {}).get('content', '').strip())
+
+    def close(self):
+        # Cancel whatever is still running and shut the loop down without blocking the caller; closed follows
+        if self.shutdown_future is None:
+            for future in list(self.requests.values()):
+                future.cancel()
+            self.shutdown_future = asyncio.run_coroutine_threadsafe(self.shutdown(), self.loop)
+            self.shutdown_future.add_done_callback(lambda _: self.loop.call_soon_threadsafe(self.loop.stop))
+        return self.shutdown_future
+
+    async def shutdown(self):
+        # Let the cancelled requests unwind first
+        requests = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+        await asyncio.gather(*requests, return_exceptions=True)
+
+        # Blocking work started with to_thread cannot be cancelled, so wait for it before the profile's stores close
+        await self.loop.shutdown_default_executor()
+
+        # Release the async connections
+        try:
+            await self.query_handler.aclose()
+        except httpx.HTTPError as e:
+            print(f"Error closing the async HTTP client: {e}")
+        finally:
+            self.shutdown_finished.emit()
+
+    def onShutdownFinished(self):
+        self.closed.emit()
@@ -0,0 +1,64 @@
+import asyncio
+from contextlib import asynccontextmanager
+
+import httpx
+
+from util.http_client import RETRY_STATUS_CODES, retryDelay
+
+
+class AsyncHttpClient:
+    """The AsyncHttpClient class wraps a pooled httpx.AsyncClient that keeps connections alive across requests, with connect and read timeouts and jittered exponential backoff on rate-limited, failed or unreachable requests; read timeouts are not retried. A semaphore caps the requests in flight, so callers beyond the limit wait their turn instead of opening more connections."""
+    def __init__(self, headers=None, connect_timeout=5, read_timeout=60, max_retries=4, pool_size=10, max_in_flight=None):
+        self.max_retries = max_retries  # Retries after the first attempt
+        self.retry_count = 0  # Retries performed over the client's lifetime
+
+        # Reuse connections across requests, with separate connect and read timeouts
+        self.client = httpx.AsyncClient(
+            headers=headers,
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size)
+        )
+
+        # Requests waiting for a slot apply back-pressure to their callers
+        self.in_flight = asyncio.Semaphore(max_in_flight or pool_size)
+
+    async def post(self, url, json=None):
+        async with self.in_flight, self.send(url, json, stream=False) as response:
+            await response.aread()
+            return response
+
+    @asynccontextmanager
+    async def stream(self, url, json=None):
+        # The response body is read by the caller while the request keeps its slot
+        async with self.in_flight, self.send(url, json, stream=True) as response:
+            yield response
+
+    @asynccontextmanager
+    async def send(self, url, json, stream):
+        for attempt in range(self.max_retries + 1):
+            is_last_attempt = attempt == self.max_retries
+            try:
+                response = await self.client.send(self.client.build_request('POST', url, json=json), stream=stream)
+            except (httpx.ConnectError, httpx.ConnectTimeout):
+                # Only failures to connect are retried, since after a read timeout the completion may already be billed
+                # Give up once the retries are used, otherwise back off and try again
+                if is_last_attempt:
+                    raise
+                delay = retryDelay(attempt)
+            else:
+                # Successful and non-retryable responses go straight back to the caller
+                if response.status_code not in RETRY_STATUS_CODES or is_last_attempt:
+                    try:
+                        yield response
+                    finally:
+                        await response.aclose()
+                    return
+                delay = retryDelay(attempt, response.headers.get('Retry-After'))
+                await response.aclose()
+
+            self.retry_count += 1
+            await asyncio.sleep(delay)
+
+    async def close(self):
+        # Release the pooled connections
+        await self.client.aclose()
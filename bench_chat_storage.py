@@ -0,0 +1,174 @@
+import argparse
+import json
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+# Qt renders offscreen so the benchmark runs on machines without a display
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+from PySide6.QtWidgets import QApplication
+
+from main_win.chat_interface import ChatInterface
+from main_win.message_renderer import messageToHtml
+from main_win.profile_context import ProfileContext
+from util.session_store import SESSION_EXTENSION, appendSessionRecords
+
+DEFAULT_SIZES = [10, 100, 1000, 10000, 100000]
+BENCHMARK_PROFILE = 'benchmark'
+
+WORDS = "the quick brown fox jumps over a lazy dog while a model explains tokens context windows and retrieval".split()
+
+
+def syntheticMessage(position, rng):
+    # Alternate roles and vary the length, with the occasional long answer
+    role = "user" if position % 2 == 0 else "assistant"
+    word_count = rng.randint(5, 40) if role == "user" else rng.choice([rng.randint(20, 120), rng.randint(300, 800)])
+    return {"role": role, "content": ' '.join(rng.choice(WORDS) for _ in range(word_count))}
+
+
+def createProfile(profiles_root):
+    # A throwaway profile with a placeholder key; nothing in the benchmark contacts the API
+    token_dir = os.path.join(profiles_root, BENCHMARK_PROFILE, 'tokens')
+    os.makedirs(token_dir, exist_ok=True)
+    with open(os.path.join(token_dir, 'api_info.env'), 'w') as file:
+        file.write('API_KEY="benchmark"\n')
+    return ProfileContext(BENCHMARK_PROFILE, profiles_root=profiles_root)
+
+
+def createSession(profile_context, size, rng):
+    session_id = f'benchmark_session_{size}'
+    session_path = os.path.join(profile_context.history_dir, f'{session_id}{SESSION_EXTENSION}')
+    messages = [syntheticMessage(position, rng) for position in range(size)]
+
+    # Write in chunks so the largest sessions do not need one huge buffer
+    for start in range(0, size, 10000):
+        appendSessionRecords(session_path, messages[start:start + 10000])
+    profile_context.getSessionCatalog().recordMessages(session_id, messages, os.path.getsize(session_path))
+    return session_path
+
+
+def percentiles(samples):
+    ordered = sorted(samples)
+
+    def at(fraction):
+        return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+    return {
+        'count': len(ordered),
+        'mean_ms': statistics.fmean(ordered),
+        'p50_ms': at(0.50),
+        'p95_ms': at(0.95),
+        'p99_ms': at(0.99),
+        'max_ms': ordered[-1],
+    }
+
+
+def measure(operation, iterations, setup=None):
+    # Time each call on its own, then repeat once under tracemalloc for the peak allocation
+    samples = []
+    for _ in range(iterations):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        operation()
+        samples.append((time.perf_counter() - start) * 1000)
+
+    if setup:
+        setup()
+    tracemalloc.start()
+    operation()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    result = percentiles(samples)
+    result['peak_memory_kb'] = peak / 1024
+    return result
+
+
+def benchmarkSize(app, chat_interface, profile_context, size, iterations, rng):
+    session_path = createSession(profile_context, size, rng)
+    results = {'session_bytes': os.path.getsize(session_path)}
+
+    # Opening a session renders only its most recent page
+    def loadSession():
+        chat_interface.loadChatSession(session_path)
+        app.processEvents()
+    results['loadChatSession'] = measure(loadSession, iterations)
+
+    results['readCurrentSessionData'] = measure(chat_interface.readCurrentSessionData, iterations)
+
+    # Scrolling up renders one more page above the current one
+    def loadPreviousPage():
+        if chat_interface.session_pager.hasPreviousPage():
+            chat_interface.loadPreviousPage()
+    results['loadPreviousPage'] = measure(loadPreviousPage, iterations, setup=loadSession)
+
+    # A new message rendered into the loaded session, and the placeholder replaced by a streamed answer
+    message = syntheticMessage(size, rng)
+    results['displayMessage'] = measure(lambda: chat_interface.displayMessage(message['role'], message['content']), iterations)
+    results['displayMessage_replace_last'] = measure(
+        lambda: chat_interface.displayMessage("assistant", message['content'], replace_last=True), iterations
+    )
+
+    results['messageToHtml'] = measure(lambda: messageToHtml(message['role'], message['content']), iterations)
+
+    # Persisting one new message appends it and updates the catalog and search index
+    def writeMessage():
+        chat_interface.conversation_history.append(syntheticMessage(size, rng))
+        chat_interface.writeToStorage()
+    results['writeToStorage'] = measure(writeMessage, iterations)
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark chat session storage and rendering as sessions grow.")
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES, help="Messages per synthetic session")
+    parser.add_argument('--iterations', type=int, default=20, help="Timed calls per operation and size")
+    parser.add_argument('--seed', type=int, default=0, help="Seed for the synthetic messages")
+    parser.add_argument('--output', default='bench_chat_storage.json', help="Where to write the JSON report")
+    args = parser.parse_args()
+
+    app = QApplication.instance() or QApplication([])
+    rng = random.Random(args.seed)
+    profiles_root = tempfile.mkdtemp(prefix='chat_storage_benchmark_')
+    profile_context = createProfile(profiles_root)
+    chat_interface = ChatInterface(profile_context)
+
+    # Give the chat a real viewport, as in the application, so opening a session pages in what fits on screen
+    chat_interface.resize(800, 600)
+    chat_interface.show()
+    app.processEvents()
+
+    report = {
+        'python': sys.version.split()[0],
+        'platform': sys.platform,
+        'iterations': args.iterations,
+        'seed': args.seed,
+        'sizes': {},
+    }
+    try:
+        for size in args.sizes:
+            started = time.perf_counter()
+            report['sizes'][str(size)] = benchmarkSize(app, chat_interface, profile_context, size, args.iterations, rng)
+            print(f"{size:>7} messages benchmarked in {time.perf_counter() - started:.1f} s")
+            for operation, result in report['sizes'][str(size)].items():
+                if isinstance(result, dict):
+                    print(f"    {operation:<28} p50 {result['p50_ms']:9.3f} ms  p99 {result['p99_ms']:9.3f} ms  peak {result['peak_memory_kb']:9.1f} KiB")
+    finally:
+        profile_context.close(wait=True)
+        shutil.rmtree(profiles_root, ignore_errors=True)
+
+    with open(args.output, 'w') as file:
+        json.dump(report, file, indent=4)
+    print(f"Report written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,26 +1,29 @@
 # Standard library imports
-from util.session_utils import customTextToHtml
+from util.session_store import SESSION_EXTENSION, SessionPager, appendSessionRecords, migrateLegacySession, readSessionHistory, sessionNameFromFile
+from util.context_manager import ContextWindowManager
+from util.async_http_client import AsyncHttpClient
+from util.response_cache import ResponseCache
+from util.index_cache import DocumentIndexCache
+from util.tracing import activeTrace, currentTrace, span, startTrace
 from datetime import datetime
+import asyncio
 import json
 import os
+import time
 
 # Third-party imports
-from dotenv import dotenv_values
-import requests
-from PySide6.QtCore import QThread, Signal, QTimer
+from PySide6.QtCore import Signal, QTimer
 from PySide6.QtWidgets import QWidget, QVBoxLayout, QTextEdit, QLineEdit, QPushButton
 
 # Local application/library specific imports
-from guidance.models import OpenAI as GuidanceOpenAI
-from llama_index.core import QueryBundle, SimpleDirectoryReader, VectorStoreIndex
-from llama_index.core.query_engine import SubQuestionQueryEngine
-from llama_index.core.tools import QueryEngineTool, ToolMetadata
-from llama_index.question_gen.guidance import GuidanceQuestionGenerator
+from .message_renderer import MessageRenderer, messageAnchor, messageToHtml
 
 
 class ChatInterface(QWidget):
     """ the ChatInterface class encapsulates the functionality required for a chat interface, including user input handling, message display, session management, and integration with external APIs for message processing. It's designed to provide a user-friendly interface for textual interaction within an application"""
-    def __init__(self, profile_name):
+    sessionUpdated = Signal(str)
+
+    def __init__(self, profile_context):
         super().__init__()
 
         layout = QVBoxLayout()
@@ -33,7 +36,7 @@ class ChatInterface(QWidget):
         self.user_input.setPlaceholderText("Type your message here...")
         
         self.user_input_send_btn = QPushButton("Send")
-        self.user_input_send_btn.clicked.connect(self.prepareMessage)
+        self.user_input_send_btn.clicked.connect(self.onSendClicked)
         self.user_input.returnPressed.connect(self.prepareMessage)
         QTimer.singleShot(100, lambda: self.user_input.setFocus())
 
@@ -44,156 +47,177 @@ class ChatInterface(QWidget):
         self.setLayout(layout)
 
         self.conversation_history = []
-        self.profile_name = profile_name
-        self.api_key = self.loadApiKey()
-        self.headers = {
-            'Authorization': f'Bearer {self.api_key}',
-            'Content-Type': 'application/json'
-        }
-        self.api_url = "https://api.openai.com/v1/chat/completions"
-
-        self.history_dir = os.path.join(os.path.dirname(__file__), '..', '..', 'profiles', self.profile_name, 'chat_history')
-
-        os.makedirs(self.history_dir, exist_ok=True)
-
+        self.request_trace = None  # Timing spans of the request in progress
+        self.async_engine = None  # Event loop running this profile's requests
+        self.active_request_id = None  # Request whose response is being shown, if one is in flight
+        self.request_session_paths = {}  # Session file each request in flight belongs to, keyed by request id
+
+        self.message_renderer = MessageRenderer(self.chat_message_box)  # Renders messages incrementally into the chat box
+
+        # Sessions open on their most recent page; older pages load when scrolling to the top
+        self.session_page_size = 50
+        self.session_pager = None
+        self.loading_previous_page = False
+        self.max_fill_pages = 5  # Pages loaded at most to make a freshly opened session scrollable
+        self.chat_message_box.verticalScrollBar().valueChanged.connect(self.onChatScrolled)
+
+        self.setProfileContext(profile_context)
+
+    def setProfileContext(self, profile_context):
+        # Credentials, paths, the query handler and the session catalog all come from the shared profile context
+        self.profile_context = profile_context
+        self.profile_name = profile_context.profile_name
+        self.history_dir = profile_context.history_dir
+        self.session_catalog = profile_context.getSessionCatalog()  # Session metadata (recency, message count, size)
+        self.query_handler = profile_context.getQueryHandler()
+
+        # Listen to the new profile's event loop instead of the previous one
+        if self.async_engine is not None:
+            self.cancelActiveRequest()
+            self.async_engine.delta.disconnect(self.onRequestDelta)
+            self.async_engine.summary_updated.disconnect(self.onRequestSummary)
+            self.async_engine.finished.disconnect(self.onRequestFinished)
+            self.async_engine.cancelled.disconnect(self.onRequestCancelled)
+        self.async_engine = profile_context.getAsyncEngine()
+        self.async_engine.delta.connect(self.onRequestDelta)
+        self.async_engine.summary_updated.connect(self.onRequestSummary)
+        self.async_engine.finished.connect(self.onRequestFinished)
+        self.async_engine.cancelled.connect(self.onRequestCancelled)
+
+        # Sessions of the previous profile no longer apply
         self.current_session_file_path = None
+        self.session_pager = None
+        self.conversation_history.clear()
+        self.message_renderer.clear()
 
-        self.query_handler = self.createQueryHandler()
-
-        self.messages_html = []  # Initialize a list to keep track of message HTML segments
-
-    def createQueryHandler(self):
-        # Configure the directory path for selected files
-        selected_files_directory = os.path.join(
-            os.path.dirname(__file__), 
-            '..', '..', 
-            'profiles', 
-            self.profile_name, 
-            'user_data_storage', 
-            'selected_files'
-        )
-
-        # Initialize variables for selected documents and acceptable extensions
-        # These can be set based on your application's requirements
-        selected_documents = []
-        acceptable_extensions = None
-
-        # Create and return a new QueryHandler instance
-        return QueryHandler(
-            selected_files_directory=selected_files_directory,
-            selected_documents=selected_documents,
-            acceptable_extensions=acceptable_extensions,
-            profile_name=self.profile_name,
-            api_url=self.api_url,
-            headers=self.headers
-        )
-
-    def loadApiKey(self):
-        # Configure the directory and path for the API key file
-        token_dir = os.path.join(
-            os.path.dirname(__file__), 
-            '..', '..', 
-            'profiles', 
-            self.profile_name, 
-            'tokens'
-        )
-        env_path = os.path.join(token_dir, 'api_info.env')
-
-        # Validate the existence of the API key file
-        if not os.path.exists(env_path):
-            raise FileNotFoundError(f"API key file not found for profile {self.profile_name}")
-
-        # Load environment variables from the .env file
-        profile_env = dotenv_values(env_path)
-
-        # Retrieve and validate the API key
-        api_key = profile_env.get('API_KEY', '').strip('"')
-        if not api_key:
-            raise ValueError(f"No API key found in {env_path}")
-
-        # Set the API key in the environment variables
-        os.environ["OPENAI_API_KEY"] = api_key
-
-        # Return the API key
-        return api_key
+    def onSendClicked(self):
+        # While a response is in flight the button stops it instead of sending
+        if self.active_request_id is not None:
+            self.async_engine.cancel(self.active_request_id)
+        else:
+            self.prepareMessage()
 
     def prepareMessage(self):
+        # One response at a time is shown in the chat
+        if self.active_request_id is not None:
+            return
+
         if user_message := self.user_input.text().strip():
-            # Display the user's message in the chat interface
-            self.displayMessage("user", user_message)
+            # Record the timing of each stage of this request, from here to the rendered response
+            self.request_trace = startTrace(user_message[:60])
+            with activeTrace(self.request_trace), span("prepareMessage"):
+                # Display the user's message in the chat interface
+                with span("render user message"):
+                    self.displayMessage("user", user_message)
 
-            # Clear the input field for the next message
-            self.user_input.clear()
+                # Clear the input field for the next message
+                self.user_input.clear()
 
-            # Append the message to the conversation history
-            self.conversation_history.append({"role": "user", "content": user_message})
+                # Append the message to the conversation history
+                self.conversation_history.append({"role": "user", "content": user_message})
 
-            # Persist the updated conversation history
-            self.writeToStorage()
+                # Persist the updated conversation history
+                with span("write session"):
+                    self.writeToStorage()
 
-            # Display the "Thinking..." message
-            self.displayMessage("assistant", "Thinking...", replace_last=False)
+                # Display the "Thinking..." message
+                self.displayMessage("assistant", "Thinking...", replace_last=False)
 
-            # Scroll to the bottom of the chat_message_box to ensure the latest message is visible
-            self.chat_message_box.verticalScrollBar().setValue(self.chat_message_box.verticalScrollBar().maximum())
-            
-            # Read the full conversation history from storage
-            self.full_conversation_history = self.readCurrentSessionData()
+                # Scroll to the bottom of the chat_message_box to ensure the latest message is visible
+                self.chat_message_box.verticalScrollBar().setValue(self.chat_message_box.verticalScrollBar().maximum())
 
-            # Append the latest user message to the full conversation history
-            self.full_conversation_history.append({"role": "user", "content": user_message})
+                # Read the full conversation history, which already ends with the user's message, and its rolling summary from storage
+                with span("read session"):
+                    self.full_conversation_history, session_summary = self.readCurrentSessionHistory()
 
-            # Initialize a background worker for processing the message
-            self.worker = ChatWorker(query_handler=self.query_handler, session_messages=self.full_conversation_history, new_message={"role": "user", "content": user_message})
+                # Reset the text accumulated from streamed response deltas
+                self.streamed_response = ''
 
-            # Connect the worker's completion signal to the method for handling responses
-            self.worker.finished.connect(self.realtimeResponse)
+                # Run the request on the profile's event loop; its deltas and result come back through the engine's signals
+                self.active_request_id = self.async_engine.submit(
+                    user_message, self.full_conversation_history, session_summary, trace=self.request_trace
+                )
+                self.request_session_paths[self.active_request_id] = self.current_session_file_path
+                self.user_input_send_btn.setText("Stop")
+
+    def onRequestDelta(self, request_id, delta):
+        if request_id == self.active_request_id:
+            self.streamResponse(delta)
+
+    def onRequestSummary(self, request_id, summary):
+        # The summary belongs to the request's session even if another session is shown by now
+        if session_path := self.request_session_paths.get(request_id):
+            appendSessionRecords(session_path, [summary])
+
+    def onRequestFinished(self, request_id, response):
+        self.request_session_paths.pop(request_id, None)
+        if request_id == self.active_request_id:
+            self.endActiveRequest()
+            self.realtimeResponse(response)
+
+    def onRequestCancelled(self, request_id):
+        self.request_session_paths.pop(request_id, None)
+        if request_id != self.active_request_id:
+            return
+        self.endActiveRequest()
 
-            # Start the background worker
-            self.worker.start()
+        # Keep whatever was streamed before the user stopped the response
+        if self.streamed_response:
+            self.realtimeResponse(self.streamed_response)
+        else:
+            self.displayMessage("assistant", "Response stopped.", replace_last=True)
+            if self.request_trace:
+                self.request_trace.finish()
+
+    def cancelActiveRequest(self):
+        # Stop the request in flight without showing its result, e.g. when another session is opened
+        if (request_id := self.active_request_id) is not None:
+            self.endActiveRequest()
+            self.async_engine.cancel(request_id)
+
+            # onRequestCancelled ignores the request now, so its trace is finished here
+            if self.request_trace:
+                self.request_trace.finish()
+
+    def endActiveRequest(self):
+        self.active_request_id = None
+        self.user_input_send_btn.setText("Send")
     
-    def realtimeResponse(self, response):
-        # Display the assistant's response in the chat interface
-        # Replace the "Thinking..." message with the actual response
-        self.displayMessage("assistant", response, replace_last=True)
+    def streamResponse(self, delta):
+        # Grow the in-progress assistant message as deltas arrive; it is persisted once the response completes
+        self.streamed_response += delta
+        with activeTrace(self.request_trace), span("render stream delta"):
+            self.displayMessage("assistant", self.streamed_response, replace_last=True)
 
-        # Update the conversation history with the assistant's response
-        self.conversation_history.append({"role": "assistant", "content": response})
+    def realtimeResponse(self, response):
+        with activeTrace(self.request_trace), span("realtimeResponse"):
+            # Display the assistant's response in the chat interface
+            # Replace the "Thinking..." message with the actual response
+            with span("render response"):
+                self.displayMessage("assistant", response, replace_last=True)
 
-        # Persist the updated conversation history
-        self.writeToStorage()
+            # Update the conversation history with the assistant's response
+            self.conversation_history.append({"role": "assistant", "content": response})
 
-        # Scroll to the bottom of the chat_message_box to ensure the latest message is visible
-        self.chat_message_box.verticalScrollBar().setValue(self.chat_message_box.verticalScrollBar().maximum())
+            # Persist the updated conversation history
+            with span("write session"):
+                self.writeToStorage()
 
-    def displayMessage(self, role, message, replace_last=False):
-        # Define message styling based on the sender's role
-        if role == "user":
-            color = "blue"
-            sender = "You"
-        elif role == "assistant":
-            color = "green"
-            sender = "Digital Assistant"
-        else:
-            color = "grey"  # Default color for undefined roles
-            sender = "Unknown"
+            # Scroll to the bottom of the chat_message_box to ensure the latest message is visible
+            self.chat_message_box.verticalScrollBar().setValue(self.chat_message_box.verticalScrollBar().maximum())
+        if self.request_trace:
+            self.request_trace.finish()
 
+    def displayMessage(self, role, message, replace_last=False, position=None):
         # Construct the HTML for the message
-        message_html = f'''
-            <div style="margin: 2px; padding: 10px;">
-                <span style="font-size: 14px; color: {color};"><b>{customTextToHtml(sender)}</b></span>
-                <span style="color: grey;">{customTextToHtml(message)}</span>
-            </div><br>'''
-
-        if replace_last and self.messages_html:
-            # Replace the last message HTML with the new one
-            self.messages_html[-1] = message_html
-        else:
-            # Append the new message HTML to the list
-            self.messages_html.append(message_html)
+        message_html = messageToHtml(role, message, position)
 
-        # Join all message HTML segments and set it as the content of the chat_message_box
-        self.chat_message_box.setHtml(''.join(self.messages_html))
+        if replace_last:
+            # Replace only the last rendered message (e.g. the "Thinking..." placeholder)
+            self.message_renderer.replaceLastMessage(message_html)
+        else:
+            # Append the new message after the existing ones
+            self.message_renderer.appendMessage(message_html)
 
         # Scroll to the bottom of the chat_message_box to ensure the latest message is visible
         self.chat_message_box.verticalScrollBar().setValue(self.chat_message_box.verticalScrollBar().maximum())
@@ -212,68 +236,123 @@ class ChatInterface(QWidget):
         if not self.current_session_file_path:
             # Generate a new session name and construct the file path
             self.current_session_file_path = os.path.join(
-                self.history_dir, f"{self.genSessionName()}.json"
+                self.history_dir, f"{self.genSessionName()}{SESSION_EXTENSION}"
             )
 
-        # Attempt to load existing messages from the session file
-        try:
-            with open(self.current_session_file_path, 'r', encoding='utf-8') as file:
-                session_messages = json.load(file)
-        except (FileNotFoundError, json.JSONDecodeError):
-            # If the file doesn't exist or the content is not valid JSON, start with an empty list
-            session_messages = []
+        # Convert legacy JSON array sessions to the append-only format before writing to them
+        self.current_session_file_path = migrateLegacySession(self.current_session_file_path)
 
-        # Append the current conversation history to the loaded messages
-        session_messages.extend(self.conversation_history)
+        # Append only the messages that have not been persisted yet
+        appendSessionRecords(self.current_session_file_path, self.conversation_history)
 
-        # Write the updated message list back to the session file
-        with open(self.current_session_file_path, 'w', encoding='utf-8') as file:
-            json.dump(session_messages, file, ensure_ascii=False, indent=4)
+        # Update the session's catalog entry and let the history sidebar move it to the top
+        session_id = sessionNameFromFile(self.current_session_file_path)
+        self.session_catalog.recordMessages(session_id, self.conversation_history, os.path.getsize(self.current_session_file_path))
+        self.sessionUpdated.emit(session_id)
 
         # Clear the in-memory conversation history after it's been persisted
         self.conversation_history.clear()
 
     def loadChatSession(self, session_file_path):
-        # Update the current session file path
-        self.current_session_file_path = session_file_path
+        # A response still streaming into the previous session would otherwise be written to this one
+        self.cancelActiveRequest()
 
-        # Load the session data from the specified file
+        # Load the session data from the specified file, converting legacy sessions so they can be paged
         try:
-            with open(session_file_path, 'r', encoding='utf-8') as file:
-                session_data = json.load(file)
+            session_file_path = migrateLegacySession(session_file_path)
+            session_pager = SessionPager(session_file_path, page_size=self.session_page_size)
         except Exception as e:
             print(f"Failed to load chat session: {e}")
             return
 
+        # Update the current session file path
+        self.current_session_file_path = session_file_path
+        self.session_pager = session_pager
+
         # Clear the chat interface to prepare for loading the session messages
-        self.chat_message_box.clear()
+        self.message_renderer.clear()
         self.conversation_history.clear() 
-        self.messages_html.clear()
         
-        # Iterate over each message in the loaded session data
-        for message in session_data:
-            # Extract the role and content for each message
-            role = message.get("role")
-            content = message.get("content")
-
+        # Display only the most recent page of messages
+        # Loaded messages are already persisted, so they are not queued in the conversation history
+        messages = self.session_pager.previousPage()
+        for position, message in enumerate(messages, start=self.session_pager.first_loaded_position):
             # Display the message in the chat interface if both role and content are available
-            if role and content:
-                self.displayMessage(role, content)
-                self.conversation_history.append(message)  # Append the loaded message to the conversation history
+            if message.get("role") and message.get("content"):
+                self.displayMessage(message["role"], message["content"], position=position)
 
         # After loading and displaying the session messages:
-        self.chat_message_box.verticalScrollBar().setValue(self.chat_message_box.verticalScrollBar().maximum())
+        scroll_bar = self.chat_message_box.verticalScrollBar()
+        scroll_bar.setValue(scroll_bar.maximum())
+        self.fillChatView()
+
+    def fillChatView(self):
+        # Load older pages until the view can scroll, otherwise the user could never reach them
+        # A hidden or unsized view cannot tell, so it is filled again once it is shown or resized
+        if self.session_pager is None or not self.chat_message_box.isVisible():
+            return
+        scroll_bar = self.chat_message_box.verticalScrollBar()
+        for _ in range(self.max_fill_pages):
+            if scroll_bar.maximum() > 0 or not self.session_pager.hasPreviousPage():
+                break
+            self.loadPreviousPage()
+
+    def showEvent(self, event):
+        super().showEvent(event)
+        QTimer.singleShot(0, self.fillChatView)
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        QTimer.singleShot(0, self.fillChatView)
+
+    def showSessionMessage(self, session_file_path, position):
+        # Open the session, then load older pages until the requested message has been rendered
+        self.loadChatSession(session_file_path)
+        if self.session_pager is None:
+            return
+        while self.session_pager.first_loaded_position > position and self.session_pager.hasPreviousPage():
+            self.loadPreviousPage()
+
+        # Bring the message into view
+        self.chat_message_box.scrollToAnchor(messageAnchor(position))
+
+    def onChatScrolled(self, value):
+        # Load the previous page of the session once the user scrolls to the top
+        scroll_bar = self.chat_message_box.verticalScrollBar()
+        if value == scroll_bar.minimum() and self.session_pager and self.session_pager.hasPreviousPage() and not self.loading_previous_page:
+            self.loadPreviousPage()
+
+    def loadPreviousPage(self):
+        self.loading_previous_page = True
+        scroll_bar = self.chat_message_box.verticalScrollBar()
+        previous_maximum = scroll_bar.maximum()
+
+        # Render the older messages above the ones already shown
+        messages = self.session_pager.previousPage()
+        messages_html = [
+            messageToHtml(message["role"], message["content"], position)
+            for position, message in enumerate(messages, start=self.session_pager.first_loaded_position)
+            if message.get("role") and message.get("content")
+        ]
+        self.message_renderer.prependMessages(messages_html)
+
+        # Keep the message the user was looking at in place rather than jumping to the new top
+        scroll_bar.setValue(scroll_bar.value() + scroll_bar.maximum() - previous_maximum)
+        self.loading_previous_page = False
 
     def readCurrentSessionData(self):
+        # Return only the messages of the current session
+        return self.readCurrentSessionHistory()[0]
+
+    def readCurrentSessionHistory(self):
         # Ensure there is a session file path set
         if not self.current_session_file_path:
             print("No current session file path set.")
-            return []
+            return [], None
 
-        # Attempt to read and parse the session data from the file
+        # Attempt to read and parse the session messages and rolling summary from the file
         try:
-            with open(self.current_session_file_path, 'r', encoding='utf-8') as file:
-                return json.load(file)
+            return readSessionHistory(self.current_session_file_path)
         except FileNotFoundError:
             print(f"Session file not found: {self.current_session_file_path}")
         except json.JSONDecodeError:
@@ -281,176 +360,234 @@ class ChatInterface(QWidget):
         except Exception as e:
             print(f"Error reading session data: {e}")
 
-        # Return an empty list in case of any errors
-        return []
+        # Return an empty history in case of any errors
+        return [], None
 
     def setFocusToUserInput(self):
         # Makes it so the user can start typing without selecting the input text field.
         self.user_input.setFocus()
 
 
-class ChatWorker(QThread):
-    """The ChatWorker class encapsulates the asynchronous processing of chat messages, leveraging the capabilities of QThread to perform potentially time-consuming operations, such as API calls or complex logic, without blocking the main application UI. It communicates the results of its processing back to the main thread via signals, allowing for a responsive and interactive user experience in chat applications."""
-    finished = Signal(str)
-
-    def __init__(self, query_handler, session_messages, new_message):
-        super().__init__()
-        self.query_handler = query_handler
-        self.session_messages = session_messages + [new_message]  # Combine session messages with the new message
-        self.new_message = new_message  # Store the new message separately
-
-    def run(self):
-        # Attempt to process the new message using the query handler
-        try:
-            # Extract the content of the new message
-            query = self.new_message.get('content', '').strip()
-
-            # Pass the query and session messages to the query handler for processing
-            response_data = self.query_handler.handleQuery(query=query, session_messages=self.session_messages)
-
-            # Check if the response contains valid data
-            if 'choices' not in response_data or not response_data['choices']:
-                # Emit a signal indicating the request could not be processed
-                self.finished.emit("I'm sorry, I couldn't process that request.")
-                return
-
-            # Extract and emit the bot's response
-            bot_response = response_data['choices'][0].get('message', {}).get('content', '').strip()
-            self.finished.emit(bot_response)
-
-        except Exception as e:
-            # Emit a signal indicating an error occurred during processing
-            self.finished.emit(f"Error processing the response: {e}")
-
-
-class ToolMetadataCreation:
-    """The ToolMetadataCreation class serves as a utility for loading, representing, and transforming metadata about tools or modules within the application. It provides a clear separation between the raw metadata (as might be stored in JSON files or similar) and the application's internal representation of such metadata, facilitating ease of use, better organization, and potential reusability of the metadata handling logic. This class could be particularly useful in applications that involve dynamic loading or utilization of various processing tools, plugins, or modules, where maintaining a clear and consistent representation of each tool's capabilities and characteristics is important."""
-    def __init__(self, name, description):
-        self.name = name
-        self.description = description
-
-    @staticmethod
-    def loadToolsFromJson(json_file_path):
-        tools = []
-        if os.path.exists(json_file_path):
-            with open(json_file_path, 'r') as file:
-                data = json.load(file)
-                # Create an instance of ToolMetadataCreation for each tool in the JSON file
-                tools.extend(
-                    ToolMetadataCreation(name=key, description=value)
-                    for key, value in data.items()
-                )
-        else:
-            print(f"File not found: {json_file_path}")
-        return tools
-
-    def toToolMetadata(self):
-        # Convert this instance's properties into a ToolMetadata object
-        return ToolMetadata(name=self.name, description=self.description)
-
-
 class QueryHandler:
     """The QueryHandler class encapsulates the logic for processing user queries in a flexible and dynamic manner, capable of leveraging both local document resources and external AI services. It demonstrates a thoughtful architecture that accommodates a range of processing strategies, from local document indexing and search to sophisticated AI-driven query understanding and response generation. This design allows for scalable and context-aware query handling within applications that require dynamic information retrieval and processing capabilities."""
-    def __init__(self, selected_files_directory, selected_documents, acceptable_extensions, profile_name, api_url, headers):
-        self.selected_files_directory = selected_files_directory
-        self.selected_documents = selected_documents
-        self.acceptable_extensions = acceptable_extensions
+    def __init__(self, profile_name, api_url, headers, index_cache_directory, response_cache_path, selection_state):
+        self.selection_state = selection_state  # Selected documents and their metadata, kept in memory between queries
         self.current_profile = profile_name
         self.api_url = api_url
         self.headers = headers
+        self.async_http_client = None  # Pooled keep-alive connections with timeouts and retries, created on the event loop that first uses them
+        self.index_cache = DocumentIndexCache(index_cache_directory)
+        self.stream_responses = True  # Stream OpenAI responses token by token when a delta callback is provided
+        self.context_manager = ContextWindowManager(token_budget=3000)  # Keeps request history within a token budget
+        self.model = "gpt-3.5-turbo"  # Chat model used for OpenAI requests
+        self.embeddings_url = "https://api.openai.com/v1/embeddings"
+        self.document_query_engine = None  # LlamaIndex query engine for selected documents, created on first use
+        self.last_query_plan = []  # Sub-questions planned for the most recent document query
+        self.max_concurrent_subqueries = 4  # Sub-questions answered at the same time during a document query
+
+        # Cache of previous responses; set similarity_threshold (e.g. 0.95) to also answer near-duplicate questions
+        self.response_cache = ResponseCache(response_cache_path, similarity_threshold=None)
 
     def queryAvailableFiles(self):
-        # Check if the selected files directory exists
-        if not os.path.exists(self.selected_files_directory):
-            print(f"Directory {self.selected_files_directory} does not exist.")
-            return False
-        
-        # Check for the presence of relevant files (ignoring JSON files and subdirectories)
-        for filename in os.listdir(self.selected_files_directory):
-            file_path = os.path.join(self.selected_files_directory, filename)
-            
-            # Check if the file is not a directory and does not have a JSON extension
-            if os.path.isfile(file_path) and not filename.endswith('.json'):
-                return True  # A relevant file is found, no need to check further
+        # The selection is only re-read from disk after it changed, so this is free on most turns
+        return self.selection_state.hasDocuments()
     
-        return False  # No relevant files were found
-    
-    def processQueryWithLlamaIndex(self, query):
-        # Path to the JSON file containing metadata about the selected files
-        selected_files_metadata_path = os.path.join(self.selected_files_directory, 'selected_descriptions.json')
-
-        # Load tool metadata from the JSON file
-        tools_metadata = ToolMetadataCreation.loadToolsFromJson(selected_files_metadata_path)
-
-        # Convert the loaded tool metadata into a different format, if necessary
-        converted_tools_metadata = [tm.toToolMetadata() for tm in tools_metadata]
-
-        # Initialize a list to hold the query engine tools
-        query_engine_tools = []
-
-        # Iterate over files in the selected directory, skipping JSON files
-        for filename in os.listdir(self.selected_files_directory):
-            if filename.endswith(".json"):
-                continue
-
-            # Construct the full path to the file and read its content
-            full_path = os.path.join(self.selected_files_directory, filename)
-            document_content = SimpleDirectoryReader(input_files=[full_path]).load_data()
-
-            # Create a query engine index from the document content
-            document_index = VectorStoreIndex.from_documents(document_content).as_query_engine(similarity_top_k=3)
-
-            # Find the corresponding tool metadata for the current file
-            filename_without_extension = os.path.splitext(filename)[0]
-            for tm in tools_metadata:
-                if tm.name == filename_without_extension:
-                    tool_metadata_converted = tm.toToolMetadata()
-
-                    # Create a query engine tool with the document index and tool metadata
-                    query_engine_tool = QueryEngineTool(query_engine=document_index, metadata=tool_metadata_converted)
-
-                    # Add the query engine tool to the list
-                    query_engine_tools.append(query_engine_tool)
-                    break
-
-        # Initialize the question generator with default settings
-        question_gen = GuidanceQuestionGenerator.from_defaults(guidance_llm=GuidanceOpenAI(model="gpt-3.5-turbo"), verbose=False)
-
-        # Generate sub-questions to further analyze or break down the main query
-        sub_questions = question_gen.generate(
-            tools=converted_tools_metadata,
-            query=QueryBundle("Compare and contrast the available documents, and select information relevant to the question asked by the user."),
+    async def aprocessQueryWithLlamaIndex(self, query):
+        # Loading the engine imports LlamaIndex and Guidance, which would otherwise block the event loop
+        document_paths, descriptions = await asyncio.to_thread(self.selection_state.selectedDocuments)
+        document_query_engine = await asyncio.to_thread(self.getDocumentQueryEngine)
+
+        # The sub-questions run as tasks on the calling loop
+        response_text, self.last_query_plan = await document_query_engine.aquery(
+            query, document_paths, descriptions, self.max_concurrent_subqueries
         )
+        return self.documentQueryResponse(response_text)
+
+    def documentQueryResponse(self, response_text):
+        # Return the response in a structured format, including the plan that produced it
+        return {
+            'choices': [{'message': {'content': response_text}}],
+            'sub_questions': [
+                {'sub_question': sub_question.sub_question, 'tool_name': sub_question.tool_name}
+                for sub_question in self.last_query_plan
+            ]
+        }
 
-        # Initialize the sub-question query engine with the generated questions and query engine tools
-        s_engine = SubQuestionQueryEngine.from_defaults(question_gen=question_gen, query_engine_tools=query_engine_tools)
-
-        # Execute the query using the sub-question query engine and obtain the response
-        response = s_engine.query(query)
+    def getDocumentQueryEngine(self):
+        # LlamaIndex and Guidance are only imported once a document query actually runs
+        if self.document_query_engine is None:
+            from .document_query import DocumentQueryEngine
+            self.document_query_engine = DocumentQueryEngine(self.index_cache, model=self.model)
+        return self.document_query_engine
 
-        # Return the response in a structured format
-        return {'choices': [{'message': {'content': response.response}}]}
-    
-    def processQueryWithOpenAI(self, session_messages):
+    def createOpenAIPayload(self, session_messages):
         # Prepare the payload for the OpenAI API request
-        payload = {
-            "model": "gpt-3.5-turbo",  # Specify the OpenAI model to use
+        return {
+            "model": self.model,  # Specify the OpenAI model to use
             "messages": session_messages,  # Include the session messages for context
             "max_tokens": 1000,  # Set the maximum length of the model's response
             "temperature": 0.7  # Control the randomness of the model's response
         }
 
-        # Send the request to the OpenAI API and capture the response
-        response = requests.post(self.api_url, headers=self.headers, json=payload)
+    def getAsyncHttpClient(self):
+        if self.async_http_client is None:
+            self.async_http_client = AsyncHttpClient(headers=self.headers)
+        return self.async_http_client
 
-        # Return the parsed JSON response
+    async def aprocessQueryWithOpenAI(self, session_messages):
+        # Send the request without blocking the event loop and return the parsed JSON response
+        response = await self.getAsyncHttpClient().post(self.api_url, json=self.createOpenAIPayload(session_messages))
         return response.json()
 
-    def handleQuery(self, query, session_messages):
-        # Check if there are local files available for processing the query
-        if self.queryAvailableFiles():
-            # Process the query using local resources
-            return self.processQueryWithLlamaIndex(query)
+    async def astreamCompletion(self, session_messages):
+        # Yield the response's deltas as the server-sent events arrive
+        payload = self.createOpenAIPayload(session_messages)
+        payload["stream"] = True
+        request_started = time.perf_counter()
+
+        async with self.getAsyncHttpClient().stream(self.api_url, json=payload) as response:
+            # Errors are returned as a regular JSON body rather than an event stream
+            if response.status_code != 200:
+                body = (await response.aread()).decode('utf-8', errors='replace')
+                raise RuntimeError(f"Request failed with status {response.status_code}: {body}")
+
+            first_delta = True
+            async for line in response.aiter_lines():
+                if not line or not line.startswith('data:'):
+                    continue
+
+                data = line[len('data:'):].strip()
+                if data == '[DONE]':
+                    break
+
+                choices = json.loads(data).get('choices') or [{}]
+                if delta := choices[0].get('delta', {}).get('content'):
+                    # Record how long the request waited for its first token
+                    if first_delta and (trace := currentTrace()):
+                        trace.addSpan("time to first token", request_started, time.perf_counter())
+                    first_delta = False
+                    yield delta
+
+    async def aprocessQueryWithOpenAIStream(self, session_messages, on_delta):
+        content = []
+        async for delta in self.astreamCompletion(session_messages):
+            content.append(delta)
+            on_delta(delta)
+
+        # Return the assembled message in the same structure as a non-streamed response
+        return {'choices': [{'message': {'content': ''.join(content)}}]}
+
+    def close(self):
+        # The response cache's connection belongs to the handler; the HTTP client is the profile's
+        self.response_cache.close()
+
+    async def aclose(self):
+        if self.async_http_client is not None:
+            await self.async_http_client.close()
+            self.async_http_client = None
+
+    async def asummarizeMessages(self, previous_summary, messages):
+        # Ask the model to fold the older messages into the existing summary
+        transcript = '\n'.join(f"{message.get('role')}: {message.get('content')}" for message in messages)
+        prompt = (
+            "Update the summary of this conversation with the new messages. Keep facts, decisions and open questions, "
+            f"and answer with the summary only.\n\nCurrent summary:\n{previous_summary or '(none)'}\n\nNew messages:\n{transcript}"
+        )
+        response_data = await self.aprocessQueryWithOpenAI([{"role": "user", "content": prompt}])
+
+        # Return None if the request failed so the caller keeps the previous summary rather than losing context
+        if not response_data.get('choices'):
+            print(f"Failed to summarize the conversation: {response_data.get('error')}")
+            return None
+        return response_data['choices'][0].get('message', {}).get('content', '').strip()
+
+    async def aembedText(self, text):
+        # Request an embedding vector for the response cache's similarity tier
+        response = await self.getAsyncHttpClient().post(self.embeddings_url, json={"model": "text-embedding-3-small", "input": text})
+        return response.json()['data'][0]['embedding']
+
+    async def acachedResponse(self, cache_request):
+        # The similarity tier compares embeddings, so the question is embedded on the loop before the SQLite lookup
+        if self.response_cache.semanticEnabled() and cache_request['question']:
+            try:
+                cache_request['embedding'] = await self.aembedText(cache_request['question'])
+            except Exception as e:
+                print(f"Failed to embed question for the response cache: {e}")
+        return await asyncio.to_thread(self.response_cache.get, cache_request)
+
+    def selectedDocumentsFingerprint(self):
+        # Identify the current document selection by the content of the selected files
+        document_paths, _ = self.selection_state.selectedDocuments()
+        content_hashes = sorted(self.index_cache.contentHash(document_path) for document_path in document_paths)
+        return ','.join(content_hashes)
+
+    async def ahandleQuery(self, query, session_messages, on_delta=None, session_summary=None, on_summary=None):
+        # Route the query to the documents or the chat API; blocking local work (disk, SQLite, token counting) runs in a thread
+        with span("QueryHandler.ahandleQuery"):
+            with span("route query"):
+                use_documents = await asyncio.to_thread(self.queryAvailableFiles)
+
+            if use_documents:
+                # Document answers depend on the question and on which documents are selected
+                with span("response cache lookup"):
+                    fingerprint = await asyncio.to_thread(self.selectedDocumentsFingerprint)
+                    cache_request = self.response_cache.prepareRequest('llama_index', [{"role": "user", "content": query}], fingerprint)
+                    response_data = await self.acachedResponse(cache_request)
+                if response_data is None:
+                    with span("document query"):
+                        response_data = await self.aprocessQueryWithLlamaIndex(query)
+                    with span("response cache store"):
+                        await asyncio.to_thread(self.response_cache.put, cache_request, response_data)
+                return response_data
+
+            # Send recent messages within the token budget, folding older ones into the rolling summary
+            with span("build context"):
+                context_messages, fold = await asyncio.to_thread(self.context_manager.buildContext, session_messages, session_summary)
+
+            # The summary is requested alongside the response rather than before it, for the next turns to use
+            summary_task = asyncio.create_task(self.afoldSummary(fold, on_summary)) if fold else None
+            try:
+                response_data = await self.acompleteChat(context_messages, on_delta)
+                if summary_task:
+                    await summary_task
+                return response_data
+            finally:
+                # A cancelled or failed request leaves the fold to a later turn
+                if summary_task:
+                    summary_task.cancel()
+
+    async def afoldSummary(self, fold, on_summary):
+        try:
+            with span("summarize history"):
+                summary_text = await self.asummarizeMessages(fold['summary'], fold['messages'])
+        except Exception as e:
+            print(f"Failed to summarize the conversation: {e}")
+            return
+
+        # If summarizing failed, the same messages are folded again on a later turn
+        if summary_text is not None and on_summary:
+            on_summary(self.context_manager.foldedSummary(fold, summary_text))
+
+    async def acompleteChat(self, context_messages, on_delta):
+        # Serve a cached answer for the same conversation context if there is one
+        with span("response cache lookup"):
+            cache_request = self.response_cache.prepareRequest(self.model, context_messages)
+            response_data = await self.acachedResponse(cache_request)
+        if response_data is not None:
+            if on_delta:
+                on_delta(response_data['choices'][0]['message']['content'])
+            return response_data
+
+        if self.stream_responses and on_delta:
+            # Stream the response so the UI can render it as it arrives
+            with span("http stream"):
+                response_data = await self.aprocessQueryWithOpenAIStream(context_messages, on_delta)
         else:
-            # Fallback to processing the query with OpenAI's API
-            return self.processQueryWithOpenAI(session_messages)
+            with span("http request"):
+                response_data = await self.aprocessQueryWithOpenAI(context_messages)
+
+        # Only successful responses are cached
+        if response_data.get('choices'):
+            with span("response cache store"):
+                await asyncio.to_thread(self.response_cache.put, cache_request, response_data)
+        return response_data
@@ -0,0 +1,90 @@
+try:
+    import tiktoken
+except ImportError:  # Fall back to an estimate when tiktoken is not installed
+    tiktoken = None
+
+
+# Tokens the chat format adds around every message
+MESSAGE_TOKEN_OVERHEAD = 4
+
+# Encodings loaded so far, keyed by model name
+_encodings = {}
+
+
+def countTokens(text, model="gpt-3.5-turbo"):
+    if tiktoken is None:
+        # Roughly four characters per token for English text
+        return len(text) // 4 + 1
+
+    # Loading an encoding is slow, so each one is only loaded once
+    if model not in _encodings:
+        try:
+            _encodings[model] = tiktoken.encoding_for_model(model)
+        except KeyError:
+            _encodings[model] = tiktoken.get_encoding("cl100k_base")
+    return len(_encodings[model].encode(text))
+
+
+def truncateToTokens(text, token_limit, model="gpt-3.5-turbo"):
+    # Keep the beginning of the text, up to the token limit
+    if countTokens(text, model) <= token_limit:
+        return text
+    if tiktoken is None:
+        return text[:max(0, token_limit) * 4]
+    return _encodings[model].decode(_encodings[model].encode(text)[:max(0, token_limit)])
+
+
+def countMessageTokens(messages, model="gpt-3.5-turbo"):
+    return sum(countTokens(message.get('content', ''), model) + MESSAGE_TOKEN_OVERHEAD for message in messages)
+
+
+class ContextWindowManager:
+    """The ContextWindowManager class keeps the messages sent to the chat API within a token budget. Recent messages are sent as they are, while older ones are folded into a rolling summary that is stored with the session, so request size stays bounded however long the session grows. The summarizing request itself is left to the caller."""
+    def __init__(self, token_budget=3000, model="gpt-3.5-turbo"):
+        self.token_budget = token_budget  # Maximum tokens of history sent with each request
+        self.model = model
+
+    def recentWindowStart(self, messages, token_limit):
+        # Walk back from the newest message, keeping as many as fit within the token limit and at least the newest one
+        used_tokens = 0
+        for index in range(len(messages) - 1, -1, -1):
+            used_tokens += countMessageTokens([messages[index]], self.model)
+            if used_tokens > token_limit and index < len(messages) - 1:
+                return index + 1
+        return 0
+
+    def buildContext(self, session_messages, summary=None):
+        # Messages already covered by the stored summary are never sent again
+        covered = summary.get('covered', 0) if summary else 0
+        summary_text = summary.get('content', '') if summary else ''
+        summary_tokens = countTokens(summary_text, self.model)
+        recent_messages = session_messages[covered:]
+        fold = None
+
+        # Only fold once the history is over budget, and then fold down to half of it so
+        # a new summary is needed about once every half budget of new messages
+        if countMessageTokens(recent_messages, self.model) + summary_tokens > self.token_budget:
+            if keep_from := self.recentWindowStart(recent_messages, self.token_budget // 2):
+                # The messages to fold into the summary, and how many session messages the new summary covers
+                fold = {"summary": summary_text, "messages": recent_messages[:keep_from], "covered": covered + keep_from}
+
+        # The fold is summarized alongside this request, so the request sends the newest messages that fit next to the current summary
+        window_limit = max(self.token_budget // 2, self.token_budget - summary_tokens)
+        recent_messages = recent_messages[self.recentWindowStart(recent_messages, window_limit):]
+
+        # A single message larger than the window is cut to fit
+        if recent_messages and countMessageTokens(recent_messages, self.model) > window_limit:
+            newest_message = recent_messages[-1]
+            content = truncateToTokens(newest_message.get('content', ''), window_limit - MESSAGE_TOKEN_OVERHEAD, self.model)
+            recent_messages[-1] = {**newest_message, 'content': content}
+
+        # Send the summary ahead of the recent messages
+        context = list(recent_messages)
+        if summary_text:
+            context.insert(0, {"role": "system", "content": f"Summary of the earlier conversation: {summary_text}"})
+
+        return context, fold
+
+    def foldedSummary(self, fold, summary_text):
+        # The summary record stored with the session once the fold's messages have been summarized
+        return {"type": "summary", "content": summary_text, "covered": fold['covered']}
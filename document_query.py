@@ -0,0 +1,112 @@
+# LlamaIndex and Guidance are slow to import, so this module is only loaded when a document query runs
+import asyncio
+import os
+
+from guidance.models import OpenAI as GuidanceOpenAI
+from llama_index.core.base.base_query_engine import BaseQueryEngine
+from llama_index.core.question_gen.types import BaseQuestionGenerator
+from llama_index.core.query_engine import SubQuestionQueryEngine
+from llama_index.core.tools import QueryEngineTool, ToolMetadata
+from llama_index.question_gen.guidance import GuidanceQuestionGenerator
+
+from util.tracing import span
+
+
+class PlanRecordingQuestionGenerator(BaseQuestionGenerator):
+    """The PlanRecordingQuestionGenerator class wraps a question generator and keeps the sub-questions it produced, so the plan a SubQuestionQueryEngine generated for a query can be inspected or reused without a second planning call."""
+    def __init__(self, question_gen):
+        self.question_gen = question_gen
+        self.sub_questions = []
+
+    def _get_prompts(self):
+        return {}
+
+    def _update_prompts(self, prompts):
+        pass
+
+    def _get_prompt_modules(self):
+        # Expose the wrapped generator's prompts as a sub-module
+        return {"question_gen": self.question_gen}
+
+    def generate(self, tools, query):
+        with span("plan sub-questions"):
+            self.sub_questions = self.question_gen.generate(tools, query)
+        return self.sub_questions
+
+    async def agenerate(self, tools, query):
+        # Guidance has no async client, so its agenerate just calls generate; run it in a thread to keep the loop free
+        with span("plan sub-questions"):
+            self.sub_questions = await asyncio.to_thread(self.question_gen.generate, tools, query)
+        return self.sub_questions
+
+
+class ConcurrencyLimitedQueryEngine(BaseQueryEngine):
+    """The ConcurrencyLimitedQueryEngine class wraps a document's query engine so that asynchronous queries wait on a semaphore shared by all documents, which caps how many sub-questions run at the same time."""
+    def __init__(self, query_engine, semaphore):
+        self.query_engine = query_engine
+        self.semaphore = semaphore
+        super().__init__(callback_manager=query_engine.callback_manager)
+
+    def _get_prompt_modules(self):
+        # Expose the wrapped engine's prompts as a sub-module
+        return {"query_engine": self.query_engine}
+
+    def _query(self, query_bundle):
+        return self.query_engine.query(query_bundle)
+
+    async def _aquery(self, query_bundle):
+        # Wait for a free slot before running the retrieval and synthesis
+        async with self.semaphore:
+            return await self.query_engine.aquery(query_bundle)
+
+
+class DocumentQueryEngine:
+    """The DocumentQueryEngine class answers a query from the selected documents with a SubQuestionQueryEngine: one tool per document backed by its cached vector index, a single planning call per query, and concurrent sub-question execution. The Guidance client and question generator are built once and reused."""
+    def __init__(self, index_cache, model="gpt-3.5-turbo"):
+        self.index_cache = index_cache
+
+        # Build the Guidance client and question generator once and reuse them for every document query
+        self.question_generator = GuidanceQuestionGenerator.from_defaults(guidance_llm=GuidanceOpenAI(model=model), verbose=False)
+
+    def buildEngine(self, document_paths, descriptions, max_concurrent_subqueries):
+        # Initialize a list to hold the query engine tools
+        query_engine_tools = []
+
+        # Sub-questions run concurrently, but no more than this many retrieve-and-synthesize calls at once
+        subquery_limit = asyncio.Semaphore(max_concurrent_subqueries)
+
+        # Create one tool per selected document that has a description
+        for document_path in document_paths:
+            document_name = os.path.splitext(os.path.basename(document_path))[0]
+            if document_name not in descriptions:
+                continue
+
+            # Load the document's persisted index, building it only if the content changed
+            with span("load document index"):
+                document_index = ConcurrencyLimitedQueryEngine(
+                    self.index_cache.loadOrBuild(document_path).as_query_engine(similarity_top_k=3), subquery_limit
+                )
+
+            # Create a query engine tool with the document index and its description
+            query_engine_tools.append(QueryEngineTool(
+                query_engine=document_index,
+                metadata=ToolMetadata(name=document_name, description=descriptions[document_name])
+            ))
+
+        # Wrap the shared question generator so this query's plan can be inspected afterwards
+        question_gen = PlanRecordingQuestionGenerator(self.question_generator)
+
+        # Initialize the sub-question query engine, which makes the only planning call for this query
+        # and answers the sub-questions concurrently across the document tools
+        s_engine = SubQuestionQueryEngine.from_defaults(question_gen=question_gen, query_engine_tools=query_engine_tools, use_async=True)
+        return s_engine, question_gen
+
+    async def aquery(self, query, document_paths, descriptions, max_concurrent_subqueries=4):
+        # Loading or building the indexes is blocking work, so it runs in a thread
+        s_engine, question_gen = await asyncio.to_thread(self.buildEngine, document_paths, descriptions, max_concurrent_subqueries)
+
+        # Planning runs in a worker thread; the sub-questions then run concurrently on the caller's event loop
+        with span("sub-question query"):
+            response = await s_engine.aquery(query)
+
+        return response.response, question_gen.sub_questions
@@ -0,0 +1,94 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+# Metadata kept for every ingested document
+DOCUMENT_FIELDS = ('description', 'content_hash', 'page_count', 'text_layer_pages', 'ocr_pages', 'token_count', 'index_path')
+
+
+class DocumentStore:
+    """The DocumentStore class keeps per-profile metadata for every ingested document in SQLite, one row per document: description, content hash, page count, how many pages came from the text layer or OCR, token count and where its index is persisted. Each upload writes only its own row in a single transaction, so concurrent uploads never overwrite each other, and lookups by document id do not read any other document."""
+    def __init__(self, db_path, data_store_directory):
+        self.data_store_directory = data_store_directory
+
+        # Uploads write from worker threads, so one connection is shared behind a lock
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(db_path, check_same_thread=False)
+        self.connection.row_factory = sqlite3.Row
+        with self.connection:
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS documents ("
+                "document_id TEXT PRIMARY KEY, description TEXT, content_hash TEXT, page_count INTEGER, "
+                "text_layer_pages INTEGER, ocr_pages INTEGER, token_count INTEGER, index_path TEXT, updated REAL NOT NULL)"
+            )
+
+        # Descriptions written before the store existed are imported once
+        if self.connection.execute("PRAGMA user_version").fetchone()[0] < 1:
+            self.importLegacyDescriptions()
+
+    def importLegacyDescriptions(self):
+        # descriptions.json maps a document's file name without extension to its description
+        json_path = os.path.join(self.data_store_directory, 'descriptions.json')
+        data = {}
+        if os.path.exists(json_path):
+            try:
+                with open(json_path, 'r') as file:
+                    data = json.load(file)
+            except (OSError, json.JSONDecodeError) as e:
+                print(f"Failed to import {json_path}: {e}")
+
+        with self.lock, self.connection:
+            for document_label, description in data.items():
+                self.connection.execute(
+                    "INSERT OR IGNORE INTO documents (document_id, description, updated) VALUES (?, ?, ?)",
+                    (self.documentIdFromLabel(document_label), description, time.time())
+                )
+            self.connection.execute("PRAGMA user_version = 1")
+
+    def documentIdFromLabel(self, document_label):
+        # Uploads are stored as text files, so the label almost always names a .txt document
+        for filename in (os.listdir(self.data_store_directory) if os.path.isdir(self.data_store_directory) else []):
+            if os.path.splitext(filename)[0] == document_label and not filename.endswith('.json'):
+                return filename
+        return f'{document_label}.txt'
+
+    def upsertDocument(self, document_id, **fields):
+        # Insert the document or update only the given fields of its row
+        unknown_fields = set(fields) - set(DOCUMENT_FIELDS)
+        if unknown_fields:
+            raise ValueError(f"Unknown document fields: {', '.join(sorted(unknown_fields))}")
+
+        columns = ['document_id', *fields, 'updated']
+        values = [document_id, *fields.values(), time.time()]
+        updates = ', '.join(f'{column} = excluded.{column}' for column in columns[1:])
+        with self.lock, self.connection:
+            self.connection.execute(
+                f"INSERT INTO documents ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))}) "
+                f"ON CONFLICT(document_id) DO UPDATE SET {updates}",
+                values
+            )
+
+    def getDocument(self, document_id):
+        with self.lock:
+            row = self.connection.execute("SELECT * FROM documents WHERE document_id = ?", (document_id,)).fetchone()
+        return dict(row) if row else None
+
+    def getDocuments(self, document_ids):
+        # Records of the given documents keyed by id; documents without metadata are left out
+        document_ids = list(document_ids)
+        if not document_ids:
+            return {}
+        with self.lock:
+            rows = self.connection.execute(
+                f"SELECT * FROM documents WHERE document_id IN ({', '.join('?' * len(document_ids))})", document_ids
+            ).fetchall()
+        return {row['document_id']: dict(row) for row in rows}
+
+    def removeDocument(self, document_id):
+        with self.lock, self.connection:
+            self.connection.execute("DELETE FROM documents WHERE document_id = ?", (document_id,))
+
+    def close(self):
+        self.connection.close()
@@ -1,13 +1,15 @@
-from PySide6.QtWidgets import QWidget, QVBoxLayout, QListWidget, QPushButton, QMessageBox, QMenu, QInputDialog
-from PySide6.QtCore import Signal
+from PySide6.QtWidgets import QWidget, QVBoxLayout, QLineEdit, QListWidget, QListWidgetItem, QPushButton, QMessageBox, QMenu, QInputDialog
+from PySide6.QtCore import Qt, Signal, QTimer
+from util.session_store import createSessionFile, SESSION_EXTENSION
 from datetime import datetime
 import os
 
 class ChatHistoryWidget(QWidget):
     sessionSelected = Signal(str)
     sessionCreated = Signal()
+    searchResultSelected = Signal(str, int)
 
-    def __init__(self, parent=None, profile_name=''):
+    def __init__(self, parent=None, profile_context=None):
         super().__init__(parent)
 
         # Create the chat history list widget
@@ -16,14 +18,35 @@ class ChatHistoryWidget(QWidget):
         # Optional: Customize the list widget appearance
         self.chat_history_list.setStyleSheet("background-color: #F0F0F0;")
 
+        # Search box for finding messages across every session of the profile
+        self.search_input = QLineEdit()
+        self.search_input.setPlaceholderText("Search all sessions...")
+        self.search_input.setClearButtonEnabled(True)
+
+        # Search hits replace the session list while there is a search query
+        self.search_results_list = QListWidget()
+        self.search_results_list.setStyleSheet("background-color: #F0F0F0;")
+        self.search_results_list.setWordWrap(True)
+        self.search_results_list.hide()
+
+        # Run the search shortly after typing stops rather than on every keystroke
+        self.search_timer = QTimer(self)
+        self.search_timer.setSingleShot(True)
+        self.search_timer.setInterval(200)
+        self.search_timer.timeout.connect(self.runSearch)
+        self.search_input.textChanged.connect(self.search_timer.start)
+        self.search_results_list.itemClicked.connect(self.onSearchResultClicked)
+
         # Set the layout for this widget
         layout = QVBoxLayout()
+        layout.addWidget(self.search_input)
         layout.addWidget(self.chat_history_list)
+        layout.addWidget(self.search_results_list)
         self.setLayout(layout)
 
-        self.profile_name = profile_name
-        self.history_dir = os.path.join(os.path.dirname(__file__), '..', '..', 'profiles', self.profile_name, 'chat_history')
-        self.populateWithFilenames()
+        self.session_items = {}  # List items keyed by session id
+        self.useProfileContext(profile_context)
+        self.populateSessions()
 
          # Select a history item in the list
         self.chat_history_list.setSelectionMode(QListWidget.SingleSelection)
@@ -36,58 +59,100 @@ class ChatHistoryWidget(QWidget):
         # Connect the itemSelectionChanged signal to a slot
         self.chat_history_list.itemSelectionChanged.connect(self.onSelectionChanged)
 
-    def populateWithFilenames(self):
-        # List all files in the specified directory
-        session_files = os.listdir(self.history_dir)
+    def populateSessions(self):
+        # Clear existing items in the list widget before adding new ones
+        self.chat_history_list.clear()
+        self.session_items.clear()
 
-        # If there are no session files, create a new session
-        if not session_files:
+        # If there are no sessions, create a new one
+        sessions = self.catalog.listSessions()
+        if not sessions:
             self.createAndSelectNewSession()
             return
-        
-        # Filter to keep only .json files
-        json_files = [file for file in session_files if file.endswith('.json')]
 
-        # Clear existing items in the list widget before adding new ones
-        self.chat_history_list.clear()
+        # Add each session's title in catalog order, most recently updated first
+        for session_id, title in sessions:
+            self.session_items[session_id] = self.createSessionItem(session_id, title)
+            self.chat_history_list.addItem(self.session_items[session_id])
 
-        # Add each JSON filename to the chat history list widget, without the '.json' extension
-        for filename in json_files:
-            display_name = os.path.splitext(filename)[0]  # Remove the '.json' extension
-            self.chat_history_list.addItem(display_name)
+        # Select the latest session
+        self.sessionSelected.emit(self.catalog.sessionPath(sessions[0][0]))
 
-        # Select the latest session if there are sessions available
-        if json_files:
-            latest_session = max(json_files)
-            latest_session_path = os.path.join(self.history_dir, latest_session)
-            self.sessionSelected.emit(latest_session_path)
+    def createSessionItem(self, session_id, title):
+        # The title is shown while the session id, which names the file, is kept with the item
+        item = QListWidgetItem(title)
+        item.setData(Qt.UserRole, session_id)
+        return item
 
-    def onSelectionChanged(self):
+    def selectedSessionId(self):
         if selected_items := self.chat_history_list.selectedItems():
-            selected_filename = f'{selected_items[0].text()}.json'
-            # Construct the full path for the selected session
-            selected_file_path = os.path.join(self.history_dir, selected_filename)
-            # Emit the full path
-            self.sessionSelected.emit(selected_file_path)
+            return selected_items[0].data(Qt.UserRole)
+        return None
 
-    def createNewSession(self):
-        new_session_name = self.genSessionName()
-        new_session_file_path = os.path.join(self.history_dir, f'{new_session_name}.json')
+    def onSelectionChanged(self):
+        if session_id := self.selectedSessionId():
+            # Emit the full path of the selected session
+            self.sessionSelected.emit(self.catalog.sessionPath(session_id))
+
+    def onSessionUpdated(self, session_id):
+        # Move the session to the top of the list, adding it if it was created outside the widget
+        if session_id in self.session_items:
+            item = self.session_items[session_id]
+            row = self.chat_history_list.row(item)
+            if row == 0:
+                return
+            was_selected = item.isSelected()
+
+            # Moving the item must not look like a new selection to listeners
+            self.chat_history_list.blockSignals(True)
+            self.chat_history_list.takeItem(row)
+            self.chat_history_list.insertItem(0, item)
+            if was_selected:
+                self.chat_history_list.setCurrentRow(0)
+            self.chat_history_list.blockSignals(False)
+        else:
+            item = self.createSessionItem(session_id, self.catalog.sessionTitle(session_id) or session_id)
+            self.session_items[session_id] = item
+            self.chat_history_list.blockSignals(True)
+            self.chat_history_list.insertItem(0, item)
+            self.chat_history_list.blockSignals(False)
+
+    def runSearch(self):
+        # An empty query brings the session list back
+        query = self.search_input.text().strip()
+        if not query:
+            self.search_results_list.hide()
+            self.chat_history_list.show()
+            return
 
-        # Create an empty JSON file for the new session
-        with open(new_session_file_path, 'w') as file:
-            file.write("[]")
+        # List the ranked hits with their session title and a snippet of the matching message
+        self.search_results_list.clear()
+        for session_id, title, position, role, snippet in self.catalog.searchMessages(query):
+            item = QListWidgetItem(f"{title}\n{role}: {snippet}")
+            item.setData(Qt.UserRole, (session_id, position))
+            self.search_results_list.addItem(item)
 
-        # Update the list of sessions displayed in the widget
-        self.populateWithFilenames()
+        self.chat_history_list.hide()
+        self.search_results_list.show()
 
-        # Find the index of the newly created session in the list of sessions
-        session_files = os.listdir(self.history_dir)
-        json_files = [file for file in session_files if file.endswith('.json')]
-        new_session_index = json_files.index(f'{new_session_name}.json')
+    def onSearchResultClicked(self, item):
+        # Open the hit's session at the matching message
+        session_id, position = item.data(Qt.UserRole)
+        self.searchResultSelected.emit(self.catalog.sessionPath(session_id), position)
 
-        # Select the newly created session in the widget
-        self.chat_history_list.setCurrentRow(new_session_index)
+    def createNewSession(self):
+        new_session_name = self.genSessionName()
+        new_session_file_path = os.path.join(self.history_dir, f'{new_session_name}{SESSION_EXTENSION}')
+
+        # Create an empty session file containing only its header record and register it in the catalog
+        createSessionFile(new_session_file_path)
+        self.catalog.addSession(new_session_name)
+
+        # Add the new session at the top of the list and select it
+        if new_session_name not in self.session_items:
+            self.session_items[new_session_name] = self.createSessionItem(new_session_name, new_session_name)
+            self.chat_history_list.insertItem(0, self.session_items[new_session_name])
+        self.chat_history_list.setCurrentItem(self.session_items[new_session_name])
 
         # Emit the signal to indicate that a new session has been created
         self.sessionCreated.emit()
@@ -110,67 +175,64 @@ class ChatHistoryWidget(QWidget):
             self.renameSelectedSession()
 
     def deleteSelectedSession(self):
-        if selected_items := self.chat_history_list.selectedItems():
-            selected_filename = f'{selected_items[0].text()}.json'
-            selected_file_path = os.path.join(self.history_dir, selected_filename)
+        if session_id := self.selectedSessionId():
+            selected_file_path = self.catalog.sessionPath(session_id)
+            selected_title = self.catalog.sessionTitle(session_id) or session_id
 
             # Confirm deletion with the user (optional)
             reply = QMessageBox.question(self, 'Delete Session',
-                                         f"Are you sure you want to delete the session '{selected_filename}'?",
+                                         f"Are you sure you want to delete the session '{selected_title}'?",
                                          QMessageBox.Yes | QMessageBox.No, QMessageBox.No)
 
             if reply == QMessageBox.Yes:
-                # Delete the file
-                os.remove(selected_file_path)
+                # Delete the file and its catalog entry
+                if os.path.exists(selected_file_path):
+                    os.remove(selected_file_path)
+                self.catalog.deleteSession(session_id)
+
+                # Remove only the deleted session from the list
+                item = self.session_items.pop(session_id)
+                self.chat_history_list.takeItem(self.chat_history_list.row(item))
 
-                # Optionally, refresh the list to reflect the deletion
-                self.populateWithFilenames()
+                # Move on to the most recent remaining session, or start a new one
+                if self.chat_history_list.count():
+                    self.selectRecentSession()
+                else:
+                    self.createAndSelectNewSession()
 
     def renameSelectedSession(self):
-        if not (selected_items := self.chat_history_list.selectedItems()):
+        if not (session_id := self.selectedSessionId()):
             return
-        selected_filename = f'{selected_items[0].text()}.json'
-        selected_file_path = os.path.join(self.history_dir, selected_filename)
 
-        # Prompt the user for a new name (without the .json extension)
-        current_name_without_extension = os.path.splitext(selected_filename)[0]
-        new_name, ok = QInputDialog.getText(self, "Rename Session", "Enter new name:", text=current_name_without_extension)
+        # Prompt the user for a new name
+        current_title = self.catalog.sessionTitle(session_id) or session_id
+        new_name, ok = QInputDialog.getText(self, "Rename Session", "Enter new name:", text=current_title)
 
-        if ok and new_name:
-            # Ensure the new name has the .json extension
-            if not new_name.endswith('.json'):
-                new_name += '.json'
-
-            new_file_path = os.path.join(self.history_dir, new_name)
-
-            # Check if a file with the new name already exists
-            if os.path.exists(new_file_path):
+        if ok and new_name and new_name != current_title:
+            # Check if a session with the new name already exists
+            if self.catalog.titleExists(new_name):
                 QMessageBox.warning(self, "Rename Failed", f"A session with the name '{new_name}' already exists.")
                 return
 
-            # Rename the file
-            os.rename(selected_file_path, new_file_path)
-
-            # Refresh the list to reflect the name change
-            self.populateWithFilenames()
+            # Only the title changes; the session file and its place in the list stay the same
+            self.catalog.renameSession(session_id, new_name)
+            self.session_items[session_id].setText(new_name)
 
-    def updateProfileName(self, profile_name):
-        self.profile_name = profile_name
-        self.update_history_dir()
-        self.populateWithFilenames()
+    def setProfileContext(self, profile_context):
+        self.useProfileContext(profile_context)
+        self.populateSessions()
 
-    def update_history_dir(self):
-        self.history_dir = os.path.join(os.path.dirname(__file__), '..', '..', 'profiles', self.profile_name, 'chat_history')
-        os.makedirs(self.history_dir, exist_ok=True)
+    def useProfileContext(self, profile_context):
+        # The history folder and session catalog are shared with the chat interface through the profile context
+        self.profile_name = profile_context.profile_name
+        self.history_dir = profile_context.history_dir
+        self.catalog = profile_context.getSessionCatalog()
 
     def selectRecentSession(self):
-        # Get the number of items in the list
-        count = self.chat_history_list.count()
-        if count > 0:
-            # Select the last item (most recent session)
-            self.chat_history_list.setCurrentRow(count - 1)
+        if self.chat_history_list.count() > 0:
+            # Select the first item (most recently updated session)
+            self.chat_history_list.setCurrentRow(0)
 
     def createAndSelectNewSession(self):
+        # createNewSession selects the session it creates
         self.createNewSession()
-        if self.chat_history_list.count() > 0:
-            self.chat_history_list.setCurrentRow(self.chat_history_list.count() - 1)
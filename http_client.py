@@ -0,0 +1,35 @@
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+import random
+
+
+# Responses worth retrying: rate limiting and transient server errors
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+def parseRetryAfter(value):
+    # Retry-After is either a number of seconds or an HTTP date
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+
+    # Dates sent with a -0000 zone parse as naive; they are still UTC
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+
+def retryDelay(attempt, retry_after=None, base_delay=0.5, max_delay=30.0):
+    # Honour the server's Retry-After when it sends one
+    if (server_delay := parseRetryAfter(retry_after)) is not None:
+        return min(server_delay, max_delay)
+
+    # Otherwise use exponential backoff with full jitter so clients do not retry in lockstep
+    return random.uniform(0, min(max_delay, base_delay * 2 ** attempt))
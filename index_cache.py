@@ -0,0 +1,106 @@
+from collections import OrderedDict
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+
+# One lock per content hash, shared by every cache in the process, so the same document is never built twice at once
+_build_locks = {}
+_build_locks_lock = threading.Lock()
+
+
+def buildLock(content_hash):
+    with _build_locks_lock:
+        return _build_locks.setdefault(content_hash, threading.Lock())
+
+
+class DocumentIndexCache:
+    """The DocumentIndexCache class keeps one persisted VectorStoreIndex per document on disk, keyed by a hash of the document's content, so a document is only chunked and embedded again when its content changes."""
+    def __init__(self, cache_directory, max_loaded_indexes=16):
+        self.cache_directory = cache_directory
+        os.makedirs(self.cache_directory, exist_ok=True)
+
+        # Content hashes keyed by (path, size, mtime) so unchanged files are not re-read on every query
+        self.content_hashes = {}
+
+        # Indexes already loaded during this run, keyed by content hash; the least recently used are dropped beyond the limit
+        self.loaded_indexes = OrderedDict()
+        self.max_loaded_indexes = max_loaded_indexes
+        self.loaded_indexes_lock = threading.Lock()
+
+    def contentHash(self, file_path):
+        # Reuse the previous hash while the file's size and modification time are unchanged
+        stat = os.stat(file_path)
+        cache_key = (os.path.abspath(file_path), stat.st_size, stat.st_mtime_ns)
+        if cache_key in self.content_hashes:
+            return self.content_hashes[cache_key]
+
+        # Hash the file in chunks to keep memory flat for large OCR outputs
+        digest = hashlib.sha256()
+        with open(file_path, 'rb') as file:
+            for chunk in iter(lambda: file.read(1024 * 1024), b''):
+                digest.update(chunk)
+
+        content_hash = digest.hexdigest()
+        self.content_hashes[cache_key] = content_hash
+        return content_hash
+
+    def indexPath(self, content_hash):
+        # Each document's index lives in its own folder named after its content hash
+        return os.path.join(self.cache_directory, content_hash)
+
+    def loadOrBuild(self, file_path):
+        content_hash = self.contentHash(file_path)
+
+        # Serve the index from memory if it was already loaded during this run
+        with self.loaded_indexes_lock:
+            if content_hash in self.loaded_indexes:
+                self.loaded_indexes.move_to_end(content_hash)
+                return self.loaded_indexes[content_hash]
+
+        # LlamaIndex is slow to import, so it is only loaded once an index is actually needed
+        from llama_index.core import StorageContext, load_index_from_storage
+
+        # Builders of the same content wait for each other; the later one then loads what the first persisted
+        persist_dir = self.indexPath(content_hash)
+        with buildLock(content_hash):
+            if os.path.isdir(persist_dir):
+                try:
+                    # Load the persisted index instead of re-embedding the document
+                    storage_context = StorageContext.from_defaults(persist_dir=persist_dir)
+                    index = load_index_from_storage(storage_context)
+                except Exception as e:
+                    # A damaged cache entry is discarded and rebuilt below
+                    print(f"Failed to load cached index for {file_path}: {e}")
+                    shutil.rmtree(persist_dir, ignore_errors=True)
+                    index = self.buildIndex(file_path, persist_dir)
+            else:
+                index = self.buildIndex(file_path, persist_dir)
+
+        with self.loaded_indexes_lock:
+            self.loaded_indexes[content_hash] = index
+            while len(self.loaded_indexes) > self.max_loaded_indexes:
+                self.loaded_indexes.popitem(last=False)
+        return index
+
+    def buildIndex(self, file_path, persist_dir):
+        from llama_index.core import SimpleDirectoryReader, VectorStoreIndex
+
+        # Read, chunk and embed the document
+        document_content = SimpleDirectoryReader(input_files=[file_path]).load_data()
+        index = VectorStoreIndex.from_documents(document_content)
+
+        # Persist into a folder of its own and move it into place so a partial write is never loaded
+        temp_dir = tempfile.mkdtemp(prefix=f'{os.path.basename(persist_dir)}.', suffix='.tmp', dir=self.cache_directory)
+        try:
+            index.storage_context.persist(persist_dir=temp_dir)
+            os.replace(temp_dir, persist_dir)
+        except OSError:
+            # Another process may have persisted the same content first, which is just as good
+            if not os.path.isdir(persist_dir):
+                raise
+        finally:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+        return index
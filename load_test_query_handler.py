@@ -0,0 +1,229 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+from main_win.profile_context import ProfileContext
+from stub_openai_server import StubConfig, startStubServer
+
+LOAD_TEST_PROFILE = 'load_test'
+
+WORDS = "how does the retrieval step choose which chunks to send and what happens when the context window is full".split()
+
+
+def percentiles(samples):
+    if not samples:
+        return None
+    ordered = sorted(samples)
+
+    def at(fraction):
+        return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+    return {'count': len(ordered), 'p50_ms': at(0.50), 'p95_ms': at(0.95), 'p99_ms': at(0.99), 'max_ms': ordered[-1]}
+
+
+def syntheticSessions(session_count, turns, rng):
+    # Every prompt names its session and turn so the response cache never answers it
+    return [
+        [f"Session {session} turn {turn}: " + ' '.join(rng.choice(WORDS) for _ in range(rng.randint(8, 30))) for turn in range(turns)]
+        for session in range(session_count)
+    ]
+
+
+def replaySessions(replay_path, session_count):
+    # Each line is {"prompt": ...}, {"role": "user", "content": ...} or {"messages": [...]}, optionally with a "session" key
+    grouped = {}
+    unassigned = []
+    with open(replay_path, 'r', encoding='utf-8') as file:
+        for line in file:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if 'messages' in record:
+                prompts = [message.get('content', '') for message in record['messages'] if message.get('role') == 'user']
+            elif 'prompt' in record:
+                prompts = [record['prompt']]
+            elif record.get('role') == 'user':
+                prompts = [record.get('content', '')]
+            else:
+                continue
+            if 'session' in record:
+                grouped.setdefault(record['session'], []).extend(prompts)
+            else:
+                unassigned.extend(prompts)
+
+    # Prompts without a session are dealt round-robin over the simulated sessions
+    sessions = list(grouped.values())
+    if unassigned:
+        extra_sessions = [[] for _ in range(max(1, session_count))]
+        for position, prompt in enumerate(unassigned):
+            extra_sessions[position % len(extra_sessions)].append(prompt)
+        sessions.extend(session for session in extra_sessions if session)
+    return sessions
+
+
+class LoadTestResults:
+    """The LoadTestResults class collects per-turn timings and outcomes from the simulated sessions, which run as tasks on one event loop."""
+    def __init__(self):
+        self.latencies = []  # Milliseconds from sending a turn to its complete answer
+        self.first_token_latencies = []  # Milliseconds until the first streamed delta
+        self.turns = 0
+        self.failures = []
+
+    def record(self, latency, first_token_latency, error=None):
+        self.turns += 1
+        if error:
+            self.failures.append(error)
+            return
+        self.latencies.append(latency)
+        if first_token_latency is not None:
+            self.first_token_latencies.append(first_token_latency)
+
+
+async def runSession(query_handler, prompts, stream, results, request_slots):
+    # Each simulated session keeps its own history and rolling summary, as the chat interface does
+    session_messages = []
+    session_summary = None
+
+    def keepSummary(summary):
+        nonlocal session_summary
+        session_summary = summary
+
+    for prompt in prompts:
+        session_messages.append({"role": "user", "content": prompt})
+        first_token_time = None
+
+        def onDelta(delta):
+            nonlocal first_token_time
+            if first_token_time is None:
+                first_token_time = time.perf_counter()
+
+        start = time.perf_counter()
+        try:
+            # Requests beyond the limit wait for a slot, as they do in AsyncQueryEngine
+            async with request_slots:
+                response_data = await query_handler.ahandleQuery(
+                    query=prompt,
+                    session_messages=list(session_messages),
+                    on_delta=onDelta if stream else None,
+                    session_summary=session_summary,
+                    on_summary=keepSummary
+                )
+        except Exception as e:
+            results.record(None, None, error=f"{type(e).__name__}: {e}")
+            session_messages.pop()
+            continue
+        latency = (time.perf_counter() - start) * 1000
+
+        if not response_data.get('choices'):
+            results.record(None, None, error=str(response_data.get('error', 'No choices in response')))
+            session_messages.pop()
+            continue
+
+        first_token_latency = (first_token_time - start) * 1000 if first_token_time is not None else None
+        results.record(latency, first_token_latency)
+        session_messages.append({"role": "assistant", "content": response_data['choices'][0]['message']['content']})
+
+
+async def runSessions(query_handler, sessions, stream, results, max_concurrent_requests):
+    # Every session runs as a task on one loop, the way the chat's requests share AsyncQueryEngine's loop
+    request_slots = asyncio.Semaphore(max_concurrent_requests)
+    try:
+        await asyncio.gather(*(runSession(query_handler, prompts, stream, results, request_slots) for prompts in sessions))
+
+        # Retries made by the async client the chat requests go through
+        return query_handler.async_http_client.retry_count if query_handler.async_http_client else 0
+    finally:
+        await query_handler.aclose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Drive concurrent chat sessions through QueryHandler.ahandleQuery against a local OpenAI-compatible stub.")
+    parser.add_argument('--sessions', type=int, default=8, help="Simulated sessions running at the same time")
+    parser.add_argument('--max-concurrent', type=int, default=8, help="Requests in flight at once, as AsyncQueryEngine's max_concurrent_requests")
+    parser.add_argument('--turns', type=int, default=5, help="Messages per synthetic session")
+    parser.add_argument('--replay', help="JSONL file of recorded prompts to replay instead of synthetic ones")
+    parser.add_argument('--no-stream', action='store_true', help="Request whole responses instead of streaming")
+    parser.add_argument('--api-url', help="Base URL of an already running stub (e.g. http://127.0.0.1:8765/v1); by default one is started in-process")
+    parser.add_argument('--latency', type=float, default=0.2, help="Stub seconds before each response")
+    parser.add_argument('--token-delay', type=float, default=0.005, help="Stub seconds between streamed tokens")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="Stub share of 500 responses")
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0, help="Stub share of 429 responses")
+    parser.add_argument('--retry-after', type=float, default=0.5, help="Stub Retry-After seconds sent with a 429")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default='load_test_query_handler.json', help="Where to write the JSON report")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    stub_config = None
+    server = None
+    if args.api_url:
+        base_url = args.api_url.rstrip('/')
+    else:
+        stub_config = StubConfig(
+            latency=args.latency, token_delay=args.token_delay, error_rate=args.error_rate,
+            rate_limit_rate=args.rate_limit_rate, retry_after=args.retry_after, seed=args.seed
+        )
+        server, base_url = startStubServer(stub_config)
+
+    sessions = replaySessions(args.replay, args.sessions) if args.replay else syntheticSessions(args.sessions, args.turns, rng)
+
+    # A throwaway profile whose query handler talks to the stub instead of the real API
+    profiles_root = tempfile.mkdtemp(prefix='query_handler_load_test_')
+    token_dir = os.path.join(profiles_root, LOAD_TEST_PROFILE, 'tokens')
+    os.makedirs(token_dir, exist_ok=True)
+    with open(os.path.join(token_dir, 'api_info.env'), 'w') as file:
+        file.write('API_KEY="load-test"\n')
+    profile_context = ProfileContext(LOAD_TEST_PROFILE, profiles_root=profiles_root)
+    profile_context.api_url = f"{base_url}/chat/completions"
+    query_handler = profile_context.getQueryHandler()
+    query_handler.embeddings_url = f"{base_url}/embeddings"
+
+    results = LoadTestResults()
+    start = time.perf_counter()
+    try:
+        retries = asyncio.run(runSessions(query_handler, sessions, not args.no_stream, results, max(1, args.max_concurrent)))
+        elapsed = time.perf_counter() - start
+
+        report = {
+            'python': sys.version.split()[0],
+            'api_url': base_url,
+            'sessions': len(sessions),
+            'concurrency': args.sessions,
+            'max_concurrent_requests': args.max_concurrent,
+            'stream': not args.no_stream,
+            'replay': args.replay,
+            'elapsed_s': elapsed,
+            'turns': results.turns,
+            'failed_turns': len(results.failures),
+            'throughput_turns_per_s': results.turns / elapsed if elapsed else None,
+            'latency': percentiles(results.latencies),
+            'first_token_latency': percentiles(results.first_token_latencies),
+            'retries': retries,
+            'response_cache': query_handler.response_cache.stats(),
+            'stub': dict(stub_config.counters) if stub_config else None,
+            'failures': results.failures[:20],
+        }
+    finally:
+        profile_context.close()
+        if server:
+            server.shutdown()
+        shutil.rmtree(profiles_root, ignore_errors=True)
+
+    with open(args.output, 'w') as file:
+        json.dump(report, file, indent=4)
+
+    print(f"{report['turns']} turns over {report['sessions']} sessions in {elapsed:.1f} s ({report['throughput_turns_per_s']:.1f} turns/s)")
+    if report['latency']:
+        print(f"Latency p50 {report['latency']['p50_ms']:.0f} ms, p95 {report['latency']['p95_ms']:.0f} ms, p99 {report['latency']['p99_ms']:.0f} ms")
+    print(f"Retries: {report['retries']}, failed turns: {report['failed_turns']}")
+    print(f"Report written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
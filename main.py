@@ -1,5 +1,4 @@
 from PySide6.QtWidgets import QApplication
-from main_win.main_win import MainWindow
 from login_win import login_interface
 
 def main():
@@ -8,6 +7,8 @@ def main():
     loginWindow = login_interface.LoginWindow()
     if loginWindow.exec():  # Show the login window and wait
         if profile_name := loginWindow.profile_name:
+            # The main window pulls in the chat stack, so it is only imported once a profile is chosen
+            from main_win.main_win import MainWindow
             mainWindow = MainWindow(profile_name)
 
             mainWindow.show()
@@ -2,13 +2,14 @@ from PySide6.QtWidgets import QMainWindow, QHBoxLayout, QWidget, QApplication
 from .chat_interface import ChatInterface
 from .history_interface import ChatHistoryWidget
 from .options_menu import OptionsMenu
-from menu_bar_options.options.profile_config import ProfileConfig
+from .profile_context import ProfileContext
 
 class MainWindow(QMainWindow):
     def __init__(self, profile_name):
         super().__init__()
         self.profile_name = profile_name
-        self.chat_interface = ChatInterface(self.profile_name)
+        self.profile_context = ProfileContext(self.profile_name)  # Shared by the chat, the history sidebar and the configuration dialog
+        self.chat_interface = ChatInterface(self.profile_context)
 
         self.setWindowTitle("Chatbot 2")
         self.setGeometry(100, 100, 800, 600)
@@ -21,7 +22,7 @@ class MainWindow(QMainWindow):
         layout = QHBoxLayout()
 
         # Initialize the chat history widget and add it to the layout
-        self.chat_history_widget = ChatHistoryWidget(profile_name=self.profile_name)
+        self.chat_history_widget = ChatHistoryWidget(profile_context=self.profile_context)
         layout.addWidget(self.chat_history_widget, stretch=3)
         chat_box.setLayout(layout)
 
@@ -40,14 +41,21 @@ class MainWindow(QMainWindow):
         # Signal from history widget selection
         self.chat_history_widget.sessionSelected.connect(self.chat_interface.loadChatSession)
 
+        # Signal from a search hit in the history widget
+        self.chat_history_widget.searchResultSelected.connect(self.chat_interface.showSessionMessage)
+
         # Connect the profileConfigWindowSignal signal to the openProfileConfig slot
         self.optionsMenu.profileConfigWindowSignal.connect(self.openProfileConfig)
+        self.optionsMenu.timingPanelSignal.connect(self.openTimingPanel)
         
         self.optionsMenu.loadProfileSignal.connect(self.onProfileLoaded)
         self.optionsMenu.createProfileSignal.connect(self.onProfileCreate)
 
         self.chat_history_widget.sessionCreated.connect(self.onSessionCreated)
 
+        # Keep the history sidebar's ordering current as messages are written
+        self.chat_interface.sessionUpdated.connect(self.chat_history_widget.onSessionUpdated)
+
     def centerWindow(self):
         # Positions window based off of current screen dimensions
         screen = QApplication.primaryScreen().geometry()
@@ -61,9 +69,17 @@ class MainWindow(QMainWindow):
         self.setMenuBar(self.optionsMenu.menubar)
 
     def openProfileConfig(self):
-        self.profileConfigWindow = ProfileConfig(parent=self, current_profile=self.profile_name)
+        # The document pipeline (PyMuPDF, OCR, LlamaIndex) is only loaded when Configuration is opened
+        from menu_bar_options.options.profile_config import ProfileConfig
+        self.profileConfigWindow = ProfileConfig(parent=self, profile_context=self.profile_context)
         self.profileConfigWindow.show()
 
+    def openTimingPanel(self):
+        # Stage breakdown of the most recent chat requests
+        from .timing_panel import TimingPanel
+        self.timingPanelWindow = TimingPanel(parent=self)
+        self.timingPanelWindow.show()
+
     def onProfileLoaded(self, profile_name):
         # Update the interface to reflect name change
         self.nameChange(profile_name)
@@ -74,10 +90,19 @@ class MainWindow(QMainWindow):
         self.nameChange(profile_name)
 
     def nameChange(self, profile_name):
+        # Switch the existing widgets over to the new profile's context and release the old one
+        previous_context = self.profile_context
         self.profile_name = profile_name
-        self.chat_history_widget.updateProfileName(profile_name)
-        self.chat_interface = ChatInterface(profile_name)
+        self.profile_context = ProfileContext(profile_name)
+        self.chat_interface.setProfileContext(self.profile_context)
+        self.chat_history_widget.setProfileContext(self.profile_context)
+        previous_context.close()
     
+    def closeEvent(self, event):
+        # Let the profile's requests wind down and release its connections before the application exits
+        self.profile_context.close(wait=True)
+        super().closeEvent(event)
+
     def onSessionCreated(self):
         # Set the user input focus when creating a new session
         self.chat_interface.setFocusToUserInput()
@@ -0,0 +1,83 @@
+from util.session_utils import customTextToHtml
+
+from PySide6.QtGui import QTextCursor
+
+
+def messageAnchor(position):
+    # Name of the anchor placed before the message at this position in its session
+    return f"message-{position}"
+
+
+def messageToHtml(role, message, position=None):
+    # Define message styling based on the sender's role
+    if role == "user":
+        color = "blue"
+        sender = "You"
+    elif role == "assistant":
+        color = "green"
+        sender = "Digital Assistant"
+    else:
+        color = "grey"  # Default color for undefined roles
+        sender = "Unknown"
+
+    # Mark messages loaded from a session so they can be scrolled to
+    anchor = f'<a name="{messageAnchor(position)}"></a>' if position is not None else ''
+
+    # Construct the HTML for the message
+    return f'''
+            <div style="margin: 2px; padding: 10px;">{anchor}
+                <span style="font-size: 14px; color: {color};"><b>{customTextToHtml(sender)}</b></span>
+                <span style="color: grey;">{customTextToHtml(message)}</span>
+            </div><br>'''
+
+
+class MessageRenderer:
+    """The MessageRenderer class writes chat messages into a QTextEdit through its document cursor, appending new messages and replacing only the last one, so the cost of rendering a message does not depend on how long the conversation already is."""
+    def __init__(self, text_edit):
+        self.text_edit = text_edit
+
+        # Length of the last rendered message, counted back from the end of the document
+        self.last_message_length = 0
+
+    def clear(self):
+        # Remove every rendered message
+        self.text_edit.clear()
+        self.last_message_length = 0
+
+    def endCursor(self):
+        # Create a cursor positioned at the end of the document
+        cursor = QTextCursor(self.text_edit.document())
+        cursor.movePosition(QTextCursor.End)
+        return cursor
+
+    def appendMessage(self, message_html):
+        # Insert the new message after everything already rendered
+        cursor = self.endCursor()
+        start_position = cursor.position()
+        cursor.insertHtml(message_html)
+
+        # Remember the message's extent so it can be replaced later
+        self.last_message_length = cursor.position() - start_position
+
+    def replaceLastMessage(self, message_html):
+        # Nothing to replace yet, so behave like an append
+        if not self.last_message_length:
+            self.appendMessage(message_html)
+            return
+
+        # Select only the last message and swap it for the new HTML
+        cursor = self.endCursor()
+        end_position = cursor.position()
+        cursor.setPosition(end_position - self.last_message_length, QTextCursor.KeepAnchor)
+        cursor.removeSelectedText()
+
+        start_position = cursor.position()
+        cursor.insertHtml(message_html)
+        self.last_message_length = cursor.position() - start_position
+
+    def prependMessages(self, messages_html):
+        # Insert older messages before everything already rendered; the last message's extent is
+        # measured from the end of the document, so it stays valid
+        cursor = QTextCursor(self.text_edit.document())
+        cursor.movePosition(QTextCursor.Start)
+        cursor.insertHtml(''.join(messages_html))
@@ -0,0 +1,35 @@
+# Kept free of GUI and LlamaIndex imports so process pool workers start quickly
+import fitz  # PyMuPDF
+from PIL import Image
+import pytesseract
+
+
+pytesseract.pytesseract.tesseract_cmd = r'C:\Program Files\Tesseract-OCR\tesseract.exe'
+
+# Pages with fewer extractable characters than this are treated as image-only and OCR'd
+MIN_TEXT_LAYER_CHARS = 20
+
+# Documents opened by this process, so a pool worker opens each file only once
+_open_documents = {}
+
+
+def extractTextLayer(page):
+    # Return the page's embedded text if it has a usable text layer, otherwise None
+    text = page.get_text()
+    return text if len(text.strip()) >= MIN_TEXT_LAYER_CHARS else None
+
+
+def ocrPage(file_path, page_num):
+    # Reuse the document if this process has already opened it
+    doc = _open_documents.get(file_path)
+    if doc is None:
+        doc = _open_documents[file_path] = fitz.open(file_path)
+
+    page = doc.load_page(page_num)  # Load the requested page
+    pix = page.get_pixmap()  # Render the page as a pixmap (image)
+
+    # Convert the pixmap to a PIL Image
+    img = Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
+
+    # Use PyTesseract to perform OCR on the image and return the text with its page number
+    return page_num, pytesseract.image_to_string(img)
@@ -10,6 +10,7 @@ class OptionsMenu(QObject):
     loadProfileSignal = Signal(str)
     createProfileSignal = Signal(str)
     profileConfigWindowSignal = Signal()
+    timingPanelSignal = Signal()
 
     def __init__(self, parent=None):
         super().__init__(parent)
@@ -33,6 +34,10 @@ class OptionsMenu(QObject):
         profileConfigAction.triggered.connect(self.onprofileConfigWindow)
         optionsMenu.addAction(profileConfigAction)
 
+        timingPanelAction = QAction('Request Timings', self.parent)
+        timingPanelAction.triggered.connect(self.timingPanelSignal.emit)
+        optionsMenu.addAction(timingPanelAction)
+
     def onLoadProfile(self):
         profile_name, ok = QInputDialog.getText(self.parent, 'Load Profile', 'Enter your profile name:')
         if ok and profile_name:
@@ -1,37 +1,44 @@
 # Standard libraries
-import json
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, as_completed
 import os
-import shutil
 
 # Third-party libraries for GUI
-from PySide6.QtCore import QThread, Signal, Qt
+from PySide6.QtCore import QObject, QThread, Signal, Qt
 from PySide6.QtWidgets import QDialog, QVBoxLayout, QPushButton, QProgressBar, QFileDialog, QMessageBox, QListWidget, QListWidgetItem
 
 # Third-party libraries for document processing and OCR
 import fitz  # PyMuPDF
-from PIL import Image
-import pytesseract
 
 # Application-specific imports
-from llama_index.core import SimpleDirectoryReader, VectorStoreIndex
-from main_win.chat_interface import ChatInterface
-
-
-pytesseract.pytesseract.tesseract_cmd = r'C:\Program Files\Tesseract-OCR\tesseract.exe'
+from util.context_manager import countTokens
+from util.index_cache import DocumentIndexCache
+from util.ocr_utils import extractTextLayer, ocrPage
+from util.selection_manifest import readSelectionManifest, writeSelectionManifest
 
 
 class ProfileConfig(QDialog):
     """The ProfileConfig class, derived from QDialog, encapsulates functionalities for managing and configuring user profiles within a GUI application, possibly for a chat interface or document management system. """
-    def __init__(self, parent=None, current_profile=None):
+    def __init__(self, profile_context, parent=None, max_concurrent_uploads=2):
         super().__init__(parent)
-        self.current_profile = current_profile
+        self.profile_context = profile_context  # Paths and credentials shared with the main window
+        self.current_profile = profile_context.profile_name
         self.setWindowTitle("Configuration")
         self.setGeometry(600, 300, 400, 300)
+        self.upload_items = {}  # Upload list entries keyed by source file path
+        self.upload_progress = {}  # Latest progress of each file in the current batch
+        self.document_store = profile_context.getDocumentStore()  # Per-document metadata of the profile
+        self.ingestion_queue = IngestionQueue(self.document_store, max_concurrent=max_concurrent_uploads, parent=self)
         self.setupUI()
         self.loadDocuments()
-        self.chat_interface = ChatInterface(current_profile)
-        api_key = self.chat_interface.loadApiKey()
-        os.environ["OPENAI_API_KEY"] = api_key
+
+        # Keep the profile's stores open until the dialog is closed and its uploads are done
+        self.profile_context.acquire(self)
+        self.finished.connect(self.releaseProfileContext)
+        self.ingestion_queue.queue_finished.connect(self.releaseProfileContext)
+
+        # Document descriptions are generated through LlamaIndex, which reads the cached key from the environment
+        self.profile_context.loadApiKey()
 
     def setupUI(self):
         layout = QVBoxLayout(self)
@@ -51,27 +58,33 @@ class ProfileConfig(QDialog):
         self.progressBar = QProgressBar()
         layout.addWidget(self.progressBar)
 
+        # Per-file status of queued, running and failed uploads
+        self.uploadListWidget = QListWidget()
+        layout.addWidget(self.uploadListWidget)
+
+        self.retryButton = QPushButton("Retry Failed Uploads")
+        self.retryButton.setEnabled(False)
+        self.retryButton.clicked.connect(self.retryFailedUploads)
+        layout.addWidget(self.retryButton)
+
+        # Route the ingestion queue's per-file reports to the upload list
+        self.ingestion_queue.file_progress.connect(self.onUploadProgress)
+        self.ingestion_queue.file_stage.connect(self.onUploadStage)
+        self.ingestion_queue.file_finished.connect(self.onUploadFinished)
+        self.ingestion_queue.file_failed.connect(self.onUploadFailed)
+        self.ingestion_queue.queue_finished.connect(self.onQueueFinished)
+
     def uploadDocument(self):
-        # Check if there's a currently loaded profile
-        if not self.current_profile:
-            # Show a warning message if no profile is loaded
-            QMessageBox.warning(self, "No Profile Loaded", "Please load or create a profile before uploading documents.")
-            return  # Exit the method if no profile is loaded
-
-        # Open a file dialog for the user to select a document to upload
-        file_path, _ = QFileDialog.getOpenFileName(self, "Open Document", "", "PDF Files (*.pdf);;Text Files (*.txt);;All Files (*)")
-
-        # If a file was selected (file_path is not empty)
-        if file_path:
-            # Call the method to process the selected file and store it in user data storage
+        # Open a file dialog for the user to select one or more documents to upload
+        file_paths, _ = QFileDialog.getOpenFileNames(self, "Open Documents", "", "PDF Files (*.pdf);;Text Files (*.txt);;All Files (*)")
+
+        # Queue each selected file for processing and storage in user data storage
+        for file_path in file_paths:
             self.userDataStorage(file_path)
 
     def userDataStorage(self, file_path):
-        # Construct the path to the data storage directory for the current profile
-        data_store_path = os.path.join(
-            os.path.dirname(__file__), '..', '..', '..', 
-            'profiles', self.current_profile, 'user_data_storage'
-        )
+        # The data storage directory of the current profile
+        data_store_path = self.profile_context.data_store_directory
 
         # Ensure the data storage directory exists; create it if it doesn't
         os.makedirs(data_store_path, exist_ok=True)
@@ -82,219 +95,334 @@ class ProfileConfig(QDialog):
         # Set the destination file path within the data store directory
         dest_file_path = os.path.join(data_store_path, base_filename)
 
-        # Initialize a Worker thread for processing the uploaded document
-        self.worker = Worker(file_path, dest_file_path)
-
-        # Connect signals from the Worker to update the progress bar and handle the upload's completion
-        self.worker.progress_updated.connect(self.progressBar.setValue)  # Update the progress bar as the Worker reports progress
-        self.worker.finished.connect(self.onUploadFinished)  # Handle the completion of the upload process
-
-        # Start the Worker thread to process the document
-        self.worker.start()
-
-    def onUploadFinished(self, dest_file_path):
-        # Notify the user that the document has been processed and saved
-        QMessageBox.information(self, "Upload Finished", f"Document processed and saved to {dest_file_path}")
-
-        # Extract the base name of the document for labeling
-        document_label, _ = os.path.splitext(os.path.basename(dest_file_path))
-        # Determine the directory where the document is saved
-        directory_path = os.path.dirname(dest_file_path)
-        # Specify a temporary processing subfolder within that directory
-        subfolder_path = os.path.join(directory_path, "temp_processing")
-
-        # Ensure the temporary processing subfolder exists
-        os.makedirs(subfolder_path, exist_ok=True)
-
-        # Temporarily move the file to the subfolder for further processing
-        temp_file_path = shutil.move(dest_file_path, subfolder_path)
-
-        # Load the document from the temporary subfolder for querying
-        file_for_query = SimpleDirectoryReader(input_dir=subfolder_path).load_data()
-        # Initialize a vector query engine with the loaded document
-        vector_query_engine = VectorStoreIndex.from_documents(file_for_query, use_async=True).as_query_engine()
-        # Perform a query to generate a brief description of the document
-        response = vector_query_engine.query("Please provide a brief description of this document in 200 words or less.")
-
-        # Construct a dictionary with the document label and its generated description
-        description_data = {document_label: str(response)}
-
-        # Determine the path for a JSON file to store descriptions in the original directory
-        json_file_path = os.path.join(directory_path, 'descriptions.json')
-
-        # Load existing descriptions from the JSON file, if it exists, and update with the new description
-        if os.path.exists(json_file_path):
-            with open(json_file_path, 'r') as file:
-                data = json.load(file)
-            data.update(description_data)
-        else:
-            data = description_data
-
-        # Write the updated descriptions back to the JSON file
-        with open(json_file_path, 'w') as file:
-            json.dump(data, file, indent=4)
-
-        # Move the processed file back to its original location
-        shutil.move(temp_file_path, dest_file_path)
-
-        # Refresh the list of documents to reflect any updates
+        # Per-document vector indexes are shared with the chat's query handler
+        index_cache_directory = self.profile_context.index_cache_directory
+
+        # Add the file to the ingestion queue, which starts it as soon as a slot is free
+        if self.ingestion_queue.enqueue(file_path, dest_file_path, index_cache_directory):
+            self.upload_progress[file_path] = 0
+            self.updateUploadItem(file_path, "Queued")
+            self.updateOverallProgress()
+
+    def updateUploadItem(self, file_path, status):
+        # Create the list entry the first time the file is seen, then update its text in place
+        if file_path not in self.upload_items:
+            self.upload_items[file_path] = QListWidgetItem()
+            self.uploadListWidget.addItem(self.upload_items[file_path])
+        self.upload_items[file_path].setText(f"{os.path.basename(file_path)} - {status}")
+
+    def updateOverallProgress(self):
+        # The progress bar shows the average progress of every file in the current batch
+        if self.upload_progress:
+            self.progressBar.setValue(int(sum(self.upload_progress.values()) / len(self.upload_progress)))
+
+    def onUploadProgress(self, file_path, progress):
+        self.upload_progress[file_path] = progress
+        self.updateOverallProgress()
+
+    def onUploadStage(self, file_path, stage):
+        self.updateUploadItem(file_path, stage)
+
+    def onUploadFinished(self, file_path, dest_file_path):
+        # Mark the document as done and refresh the list of documents so it can be selected right away
+        self.upload_progress[file_path] = 100
+        self.updateOverallProgress()
+        self.updateUploadItem(file_path, "Done")
         self.loadDocuments()
 
+        # A new or re-uploaded document may change the selected documents' descriptions
+        self.profile_context.getSelectionState().invalidate()
+
+    def onUploadFailed(self, file_path, error_message):
+        # A failure only affects its own file; it stays listed so it can be retried
+        self.upload_progress[file_path] = 100
+        self.updateOverallProgress()
+        self.updateUploadItem(file_path, f"Failed: {error_message}")
+        self.retryButton.setEnabled(True)
+
+    def onQueueFinished(self):
+        # Start the next batch with a fresh overall progress
+        self.upload_progress.clear()
+        self.retryButton.setEnabled(self.ingestion_queue.hasFailedUploads())
+
+    def releaseProfileContext(self):
+        if not self.isVisible() and self.ingestion_queue.isIdle():
+            self.profile_context.release(self)
+
+    def retryFailedUploads(self):
+        # Put every failed file back on the queue
+        for file_path in self.ingestion_queue.retryFailed():
+            self.upload_progress[file_path] = 0
+            self.updateUploadItem(file_path, "Queued")
+        self.updateOverallProgress()
+        self.retryButton.setEnabled(False)
+
     def loadDocuments(self):
         # Clear the document list widget to refresh the list of documents
         self.documentListWidget.clear()
 
-        # Construct the path to the data storage directory for the current profile
-        data_store_path = os.path.join(
-            os.path.dirname(__file__), '..', '..', '..', 
-            'profiles', self.current_profile, 'user_data_storage'
-        )
+        # The data storage directory of the current profile
+        data_store_path = self.profile_context.data_store_directory
+
+        # Documents in the current selection start out checked
+        selected_ids = set(readSelectionManifest(data_store_path))
+        document_ids = []
 
         # Check if the data storage directory exists
         if os.path.exists(data_store_path):
             # Iterate over each file in the data storage directory
             for filename in os.listdir(data_store_path):
+                # Skip JSON and temporary files and directories (index cache, temporary processing)
+                if filename.endswith(('.json', '.tmp')) or os.path.isdir(os.path.join(data_store_path, filename)):
+                    continue
+
                 # Create a new list widget item for each document
                 item = QListWidgetItem(filename)
                 
                 # Enable the item to be checkable by setting the appropriate flag
                 item.setFlags(item.flags() | Qt.ItemIsUserCheckable)
                 
-                # Set the initial state of the item to unchecked
-                item.setCheckState(Qt.Unchecked)
+                # Set the initial state of the item from the selection manifest
+                item.setCheckState(Qt.Checked if filename in selected_ids else Qt.Unchecked)
                 
                 # Add the item to the document list widget
                 self.documentListWidget.addItem(item)
+                document_ids.append(filename)
 
-    def selectedDocs(self):
-        # Initialize an empty list to hold the full paths of selected documents
-        checked_items = []
-
-        # Construct the base path to the user data storage directory
-        data_store_path = os.path.join(
-            os.path.dirname(__file__), '..', '..', '..', 
-            'profiles', self.current_profile, 'user_data_storage'
-        )
-
-        # Iterate over each item in the document list widget
+        # Show each document's description when hovering over it
+        records = self.document_store.getDocuments(document_ids)
         for index in range(self.documentListWidget.count()):
-            item = self.documentListWidget.item(index)  # Retrieve the item at the current index
-            
-            # Check if the item is selected (checked)
-            if item.checkState() == Qt.Checked:
-                # Construct the full path to the selected document
-                full_path = os.path.join(data_store_path, item.text())
-                # Add the full path of the selected document to the list
-                checked_items.append(full_path)
-
-        # Pass the list of selected documents' paths to be copied or further processed
-        self.copy_selected_files(checked_items)
-
-    def copy_selected_files(self, selected_docs_paths):
-        # Define the target directory for selected files within the current profile's data storage
-        target_directory = os.path.join(
-            os.path.dirname(__file__), '..', '..', '..', 
-            'profiles', self.current_profile, 'user_data_storage', 'selected_files'
-        )
-        
-        # Ensure the target directory exists, creating it if necessary
-        os.makedirs(target_directory, exist_ok=True)
-
-        # Extract the base filenames of the selected documents to manage file presence in the target directory
-        selected_filenames = {os.path.basename(path) for path in selected_docs_paths}
-
-        # Copy each selected document to the target directory
-        for file_path in selected_docs_paths:
-            filename = os.path.basename(file_path)
-            dest_path = os.path.join(target_directory, filename)
-            shutil.copy2(file_path, dest_path)  # copy2 is used to preserve file metadata
-
-        # Remove any files in the target directory that were not selected
-        for filename in os.listdir(target_directory):
-            if filename not in selected_filenames:
-                os.remove(os.path.join(target_directory, filename))
-
-        # Define the path to the source JSON file containing document descriptions
-        source_json_path = os.path.join(
-            os.path.dirname(__file__), '..', '..', '..', 
-            'profiles', self.current_profile, 'user_data_storage', 'descriptions.json'
-        )
-
-        # Synchronize the metadata from the source JSON file to the selected files in the target directory
-        self.sync_json_metadata_to_selected_files(source_json_path, target_directory)
-
-    def sync_json_metadata_to_selected_files(self, source_json_path, selected_files_folder):
-        # Check if the source JSON file exists
-        if not os.path.exists(source_json_path):
-            print(f"Source JSON file not found: {source_json_path}")
-            return
-
-        # Load data from the source JSON file
-        with open(source_json_path, 'r') as file:
-            data = json.load(file)
-
-        # Create a set of selected filenames without their extensions
-        selected_filenames_no_ext = {
-            os.path.splitext(filename)[0] for filename in os.listdir(selected_files_folder)
-        }
-
-        # Filter the data to include only entries that match the selected filenames
-        selected_data = {
-            filename: desc for filename, desc in data.items() 
-            if filename in selected_filenames_no_ext
-        }
+            item = self.documentListWidget.item(index)
+            if (record := records.get(item.text())) and record['description']:
+                item.setToolTip(record['description'])
 
-        # Define the path for the target JSON file within the selected files folder
-        target_json_path = os.path.join(selected_files_folder, 'selected_descriptions.json')
+    def selectedDocs(self):
+        # The ids of the checked documents are their file names in the data storage directory
+        selected_ids = [
+            self.documentListWidget.item(index).text()
+            for index in range(self.documentListWidget.count())
+            if self.documentListWidget.item(index).checkState() == Qt.Checked
+        ]
 
-        # Write the filtered metadata to the target JSON file
-        with open(target_json_path, 'w') as file:
-            json.dump(selected_data, file, indent=4)
+        # Only the manifest is written; the documents and their cached indexes stay where they are
+        writeSelectionManifest(self.profile_context.data_store_directory, selected_ids)
 
     def finalizeDocumentSelection(self):
         # This method will be called when the "Finalize Selection" button is clicked
-        # It can call selectedDocs, which processes and copies the selected documents
+        # It calls selectedDocs, which records the selected documents in the selection manifest
         self.selectedDocs()
 
+        # Let the chat pick up the new selection on its next query
+        self.profile_context.getSelectionState().invalidate()
+
         # Optional: Provide feedback to the user or further actions after selection
         QMessageBox.information(self, "Selection Finalized", "You can now chat with the selected documents!")
 
+class IngestionQueue(QObject):
+    """The IngestionQueue class runs document ingestion Workers for a batch of uploads, starting at most max_concurrent of them at a time. Each file reports its own progress and a failed file does not stop the others; failures are kept so they can be retried. Uploads that write the same document run one after another."""
+    file_progress = Signal(str, int)
+    file_stage = Signal(str, str)
+    file_finished = Signal(str, str)
+    file_failed = Signal(str, str)
+    queue_finished = Signal()
+
+    def __init__(self, document_store, max_concurrent=2, parent=None):
+        super().__init__(parent)
+        self.document_store = document_store  # Where each Worker records its document's metadata
+        self.max_concurrent = max(1, max_concurrent)
+        self.pending = deque()  # Uploads waiting for a free slot
+        self.active = {}  # Running Workers keyed by source file path
+        self.failed_uploads = {}  # Failed uploads keyed by source file path, kept for retrying
+
+        # Share the CPU cores between the Workers that can run at the same time
+        self.ocr_workers_per_upload = max(1, (os.cpu_count() or 1) // self.max_concurrent)
+
+    def enqueue(self, file_path, dest_file_path, index_cache_directory):
+        # Ignore a file that is already queued or running
+        if file_path in self.active or any(upload[0] == file_path for upload in self.pending):
+            return False
+
+        self.failed_uploads.pop(file_path, None)
+        self.pending.append((file_path, dest_file_path, index_cache_directory))
+        self.startNext()
+        return True
+
+    def retryFailed(self):
+        # Move every failed upload back onto the queue and return the files being retried
+        failed_uploads = list(self.failed_uploads.values())
+        self.failed_uploads.clear()
+        for upload in failed_uploads:
+            self.enqueue(*upload)
+        return [upload[0] for upload in failed_uploads]
+
+    def hasFailedUploads(self):
+        return bool(self.failed_uploads)
+
+    def isIdle(self):
+        return not self.active and not self.pending
+
+    def startNext(self):
+        # Files with the same name share one destination document and index entry, so they run one after another
+        running_destinations = {os.path.normcase(upload[1]) for _, upload in self.active.values()}
+        waiting = deque()
+
+        # Start queued uploads until the concurrency limit is reached
+        while self.pending and len(self.active) < self.max_concurrent:
+            file_path, dest_file_path, index_cache_directory = self.pending.popleft()
+            if os.path.normcase(dest_file_path) in running_destinations:
+                waiting.append((file_path, dest_file_path, index_cache_directory))
+                continue
+            running_destinations.add(os.path.normcase(dest_file_path))
+            worker = Worker(file_path, dest_file_path, index_cache_directory, self.document_store, max_workers=self.ocr_workers_per_upload)
+
+            # Tag every report from the Worker with the file it belongs to
+            worker.progress_updated.connect(lambda progress, path=file_path: self.file_progress.emit(path, progress))
+            worker.stage_changed.connect(lambda stage, path=file_path: self.file_stage.emit(path, stage))
+            worker.finished.connect(lambda dest, path=file_path: self.onWorkerFinished(path, dest))
+            worker.failed.connect(lambda error, path=file_path: self.onWorkerFailed(path, error))
+
+            self.active[file_path] = (worker, (file_path, dest_file_path, index_cache_directory))
+            worker.start()
+
+        # Uploads held back keep their place at the front of the queue
+        self.pending.extendleft(reversed(waiting))
+
+    def releaseWorker(self, file_path):
+        # The Worker emits its result as the last step of run(), so waiting here is brief and makes it safe to drop
+        worker, upload = self.active.pop(file_path)
+        worker.wait()
+        return upload
+
+    def onWorkerFinished(self, file_path, dest_file_path):
+        self.releaseWorker(file_path)
+        self.file_finished.emit(file_path, dest_file_path)
+        self.onSlotFreed()
+
+    def onWorkerFailed(self, file_path, error_message):
+        self.failed_uploads[file_path] = self.releaseWorker(file_path)
+        self.file_failed.emit(file_path, error_message)
+        self.onSlotFreed()
+
+    def onSlotFreed(self):
+        # Start the next upload, or report the end of the batch once nothing is left
+        self.startNext()
+        if self.isIdle():
+            self.queue_finished.emit()
+
+
 class Worker(QThread):
-    """The Worker class, inheriting from QThread, is designed to perform document processing in a separate thread, converting document pages to images and then extracting text using Optical Character Recognition (OCR) with PyTesseract."""
+    """The Worker class, inheriting from QThread, runs the whole document ingestion pipeline in a separate thread: text extraction, indexing, description generation and the metadata write. Pages with an embedded text layer are extracted directly with PyMuPDF; image-only pages are converted to images and OCR'd with PyTesseract in parallel on a process pool, and the text is reassembled in page order."""
     progress_updated = Signal(int)
+    stage_changed = Signal(str)
     finished = Signal(str)
+    failed = Signal(str)
+
+    # Share of the progress bar given to each stage of the pipeline
+    EXTRACTION_PROGRESS = 70
+    INDEXING_PROGRESS = 85
+    DESCRIPTION_PROGRESS = 95
 
-    def __init__(self, file_path, dest_file_path, parent=None):
+    def __init__(self, file_path, dest_file_path, index_cache_directory, document_store, max_workers=None, parent=None):
         super().__init__(parent)
         self.file_path = file_path  # Path to the source document
         self.dest_file_path = dest_file_path  # Path where the extracted text will be saved
+        self.index_cache_directory = index_cache_directory  # Where the document's vector index is persisted
+        self.document_store = document_store  # Where the document's metadata is recorded
+        self.max_workers = max_workers or os.cpu_count() or 1  # Number of processes used for OCR
+        self.page_count = 0  # Pages in the source document
+        self.text_layer_pages = 0  # Pages read from the embedded text layer
+        self.ocr_pages = 0  # Pages that needed OCR
+        self.token_count = 0  # Tokens in the extracted text
 
     def run(self):
-        # Open the source document using PyMuPDF
-        doc = fitz.open(self.file_path)
-        content = ''  # Initialize an empty string to accumulate extracted text
-
-        total_pages = len(doc)  # Get the total number of pages in the document
-
-        # Iterate over each page in the document
-        for page_num in range(total_pages):
-            page = doc.load_page(page_num)  # Load the current page
-            pix = page.get_pixmap()  # Render the page as a pixmap (image)
-            
-            # Convert the pixmap to a PIL Image
-            img = Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
-            
-            # Use PyTesseract to perform OCR on the image and extract text
-            content += pytesseract.image_to_string(img)
-            
-            # Emit a signal to update the progress based on the current page number
-            self.progress_updated.emit(int((page_num + 1) / total_pages * 100))
-
-        # Write the accumulated text content to the destination file
-        with open(self.dest_file_path, 'w', encoding='utf-8') as outfile:
-            outfile.write(content)
-
-        doc.close()  # Close the document to free resources
+        try:
+            self.stage_changed.emit("Extracting text")
+            self.extractText()
+
+            self.stage_changed.emit("Indexing")
+            index_cache = DocumentIndexCache(self.index_cache_directory)
+            index = index_cache.loadOrBuild(self.dest_file_path)
+            self.progress_updated.emit(self.INDEXING_PROGRESS)
+
+            self.stage_changed.emit("Describing")
+            description = self.describeDocument(index)
+            self.progress_updated.emit(self.DESCRIPTION_PROGRESS)
+
+            self.stage_changed.emit("Saving")
+            content_hash = index_cache.contentHash(self.dest_file_path)
+            self.writeMetadata(description, content_hash, index_cache.indexPath(content_hash))
+            self.progress_updated.emit(100)
+        except Exception as e:
+            # Report the failure instead of letting the thread die silently
+            self.failed.emit(str(e))
+            return
 
         # Emit a signal indicating that the processing is finished, along with the destination path
         self.finished.emit(self.dest_file_path)
+
+    def reportExtractionProgress(self, completed_pages, total_pages):
+        # Scale page progress into the extraction stage's share of the progress bar
+        self.progress_updated.emit(int(completed_pages / total_pages * self.EXTRACTION_PROGRESS))
+
+    def extractText(self):
+        page_texts = {}  # Extracted text keyed by page number, filled in as pages complete
+        ocr_page_nums = []  # Pages without a usable text layer
+
+        # Open the source document using PyMuPDF and read the embedded text layer where there is one
+        with fitz.open(self.file_path) as doc:
+            total_pages = len(doc)  # Get the total number of pages in the document
+
+            for page_num in range(total_pages):
+                text = extractTextLayer(doc.load_page(page_num))
+                if text is None:
+                    ocr_page_nums.append(page_num)
+                else:
+                    page_texts[page_num] = text
+
+        # Record how each page was extracted
+        self.page_count = total_pages
+        self.text_layer_pages = total_pages - len(ocr_page_nums)
+        self.ocr_pages = len(ocr_page_nums)
+
+        # Pages with a text layer are already done
+        completed_pages = self.text_layer_pages
+        if total_pages:
+            self.reportExtractionProgress(completed_pages, total_pages)
+
+        if ocr_page_nums:
+            # Spread the image-only pages across a pool of processes, never starting more processes than pages
+            with ProcessPoolExecutor(max_workers=min(self.max_workers, len(ocr_page_nums))) as executor:
+                futures = [executor.submit(ocrPage, self.file_path, page_num) for page_num in ocr_page_nums]
+
+                # Collect pages as they finish, which is not necessarily in page order
+                for future in as_completed(futures):
+                    page_num, text = future.result()
+                    page_texts[page_num] = text
+                    completed_pages += 1
+
+                    # Update the progress based on the number of completed pages
+                    self.reportExtractionProgress(completed_pages, total_pages)
+
+        # Reassemble the text in page order and write it to the destination file
+        content = ''.join(page_texts[page_num] for page_num in range(total_pages))
+        self.token_count = countTokens(content)
+        with open(self.dest_file_path, 'w', encoding='utf-8') as outfile:
+            outfile.write(content)
+
+    def describeDocument(self, index):
+        # Perform a query to generate a brief description of the document
+        response = index.as_query_engine().query("Please provide a brief description of this document in 200 words or less.")
+        return str(response)
+
+    def writeMetadata(self, description, content_hash, index_path):
+        # Upsert only this document's row, so uploads finishing at the same time cannot overwrite each other
+        self.document_store.upsertDocument(
+            os.path.basename(self.dest_file_path),
+            description=description,
+            content_hash=content_hash,
+            page_count=self.page_count,
+            text_layer_pages=self.text_layer_pages,
+            ocr_pages=self.ocr_pages,
+            token_count=self.token_count,
+            index_path=index_path
+        )
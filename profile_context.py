@@ -0,0 +1,164 @@
+import concurrent.futures
+import os
+
+from dotenv import dotenv_values
+
+from util.document_store import DocumentStore
+from util.selection_manifest import migrateLegacySelection
+from util.session_catalog import SessionCatalog
+
+# Folder holding one sub-folder per profile
+PROFILES_ROOT = os.path.join(os.path.dirname(__file__), '..', '..', 'profiles')
+
+# Closed contexts still draining requests or used by a dialog; kept referenced until their resources are closed
+_closing_contexts = set()
+
+# Seconds to wait at exit for requests in flight to wind down
+ENGINE_SHUTDOWN_TIMEOUT = 10
+
+
+class ProfileContext:
+    """The ProfileContext class owns everything tied to one profile: its paths, the cached API credentials, the query handler with its async engine, the document store and the session catalog. The main window, the history sidebar and the configuration dialog share one instance, so each of these is created once per profile rather than once per widget."""
+    def __init__(self, profile_name, profiles_root=PROFILES_ROOT):
+        self.profile_name = profile_name
+        self.profile_dir = os.path.join(profiles_root, profile_name)
+
+        # Where the profile keeps its sessions, credentials and documents
+        self.history_dir = os.path.join(self.profile_dir, 'chat_history')
+        self.env_path = os.path.join(self.profile_dir, 'tokens', 'api_info.env')
+        self.data_store_directory = os.path.join(self.profile_dir, 'user_data_storage')
+        self.index_cache_directory = os.path.join(self.data_store_directory, 'index_cache')
+        self.session_catalog_path = os.path.join(self.profile_dir, 'session_catalog.sqlite')
+        self.response_cache_path = os.path.join(self.profile_dir, 'response_cache.sqlite')
+        self.document_store_path = os.path.join(self.profile_dir, 'document_store.sqlite')
+        os.makedirs(self.history_dir, exist_ok=True)
+
+        self.api_url = "https://api.openai.com/v1/chat/completions"
+        self.api_key = None  # Read from the profile's env file on first use
+
+        # Created on first use and shared from then on
+        self.query_handler = None
+        self.async_engine = None
+        self.session_catalog = None
+        self.selection_state = None
+        self.document_store = None
+
+        # Dialogs still using the profile's stores, e.g. while their uploads finish; closing waits for them
+        self.users = set()
+        self.closing = False
+
+    def loadApiKey(self):
+        # The env file is only read once per profile
+        if self.api_key:
+            return self.api_key
+
+        # Validate the existence of the API key file
+        if not os.path.exists(self.env_path):
+            raise FileNotFoundError(f"API key file not found for profile {self.profile_name}")
+
+        # Retrieve and validate the API key
+        api_key = dotenv_values(self.env_path).get('API_KEY', '').strip('"')
+        if not api_key:
+            raise ValueError(f"No API key found in {self.env_path}")
+
+        # LlamaIndex reads the key from the environment
+        os.environ["OPENAI_API_KEY"] = api_key
+
+        self.api_key = api_key
+        return self.api_key
+
+    def headers(self):
+        return {
+            'Authorization': f'Bearer {self.loadApiKey()}',
+            'Content-Type': 'application/json'
+        }
+
+    def getQueryHandler(self):
+        if self.query_handler is None:
+            # Imported here so the context can be created without loading the chat module
+            from .chat_interface import QueryHandler
+            self.query_handler = QueryHandler(
+                profile_name=self.profile_name,
+                api_url=self.api_url,
+                headers=self.headers(),
+                index_cache_directory=self.index_cache_directory,
+                response_cache_path=self.response_cache_path,
+                selection_state=self.getSelectionState()
+            )
+        return self.query_handler
+
+    def getAsyncEngine(self):
+        # The event loop the chat requests of this profile run on
+        if self.async_engine is None:
+            from .async_engine import AsyncQueryEngine
+            self.async_engine = AsyncQueryEngine(self.getQueryHandler())
+        return self.async_engine
+
+    def getSelectionState(self):
+        # Selected documents, kept in memory and refreshed when the selected files change
+        if self.selection_state is None:
+            from .selection_state import SelectionState
+
+            # Profiles that still keep copies in selected_files are converted to a selection manifest first
+            migrateLegacySelection(self.data_store_directory)
+            self.selection_state = SelectionState(self.data_store_directory, self.getDocumentStore())
+        return self.selection_state
+
+    def getDocumentStore(self):
+        # Per-document metadata shared by the configuration dialog, its upload workers and the query handler
+        if self.document_store is None:
+            os.makedirs(self.data_store_directory, exist_ok=True)
+            self.document_store = DocumentStore(self.document_store_path, self.data_store_directory)
+        return self.document_store
+
+    def getSessionCatalog(self):
+        # Open the profile's session catalog and pick up any sessions it does not know about yet
+        if self.session_catalog is None:
+            self.session_catalog = SessionCatalog(self.session_catalog_path, self.history_dir)
+            self.session_catalog.syncWithDirectory()
+        return self.session_catalog
+
+    def acquire(self, user):
+        self.users.add(user)
+
+    def release(self, user):
+        self.users.discard(user)
+        if self.closing:
+            self.closeResources()
+
+    def close(self, wait=False):
+        # Stop the profile's requests before releasing what they use; the engine drains without blocking the UI
+        self.closing = True
+        _closing_contexts.add(self)
+        if self.async_engine is None:
+            self.closeResources()
+            return
+        self.async_engine.closed.connect(self.onEngineClosed)
+        shutdown = self.async_engine.close()
+
+        # On exit there is no event loop left to deliver closed, so wait for the engine here
+        if wait:
+            try:
+                shutdown.result(timeout=ENGINE_SHUTDOWN_TIMEOUT)
+            except concurrent.futures.TimeoutError:
+                print(f"Requests of profile {self.profile_name} were still running at exit")
+            self.onEngineClosed()
+
+    def onEngineClosed(self):
+        self.async_engine = None
+        self.closeResources()
+
+    def closeResources(self):
+        # Shared stores stay open while the engine drains or a dialog still uses them; the last of these closes them
+        if self.async_engine is not None or self.users:
+            return
+        _closing_contexts.discard(self)
+        if self.query_handler is not None:
+            self.query_handler.close()
+            self.query_handler = None
+        if self.session_catalog is not None:
+            self.session_catalog.close()
+            self.session_catalog = None
+        if self.document_store is not None:
+            self.document_store.close()
+            self.document_store = None
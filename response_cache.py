@@ -0,0 +1,124 @@
+import hashlib
+import json
+import math
+import sqlite3
+import threading
+import time
+
+
+def normalizeText(text):
+    # Ignore differences in case and whitespace when matching prompts
+    return ' '.join(str(text).lower().split())
+
+
+def cosineSimilarity(first, second):
+    dot = sum(a * b for a, b in zip(first, second))
+    norm = math.sqrt(sum(a * a for a in first)) * math.sqrt(sum(b * b for b in second))
+    return dot / norm if norm else 0.0
+
+
+class ResponseCache:
+    """The ResponseCache class stores LLM responses per profile in SQLite, keyed by model, normalized prompt context and the fingerprint of the selected documents. An optional embedding-similarity tier also answers near-duplicate questions asked in the same context. Entries expire after a TTL, the least recently used ones are evicted beyond a size limit, and hit/miss counters are kept with the cache."""
+    def __init__(self, db_path, max_entries=1000, ttl_seconds=7 * 24 * 3600, similarity_threshold=None):
+        self.max_entries = max_entries  # Entries kept before the least recently used are evicted
+        self.ttl_seconds = ttl_seconds  # Age after which an entry is no longer served
+        self.similarity_threshold = similarity_threshold  # Minimum cosine similarity for a semantic hit; None disables the tier
+
+        # Queries run on worker threads, so one connection is shared behind a lock
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(db_path, check_same_thread=False)
+        with self.connection:
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "key TEXT PRIMARY KEY, scope TEXT NOT NULL, response TEXT NOT NULL, embedding TEXT, "
+                "created REAL NOT NULL, last_access REAL NOT NULL, hits INTEGER NOT NULL DEFAULT 0)"
+            )
+            self.connection.execute("CREATE INDEX IF NOT EXISTS entries_scope ON entries (scope)")
+            self.connection.execute("CREATE INDEX IF NOT EXISTS entries_last_access ON entries (last_access)")
+            self.connection.execute("CREATE TABLE IF NOT EXISTS stats (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+
+    def prepareRequest(self, model, messages, fingerprint=''):
+        # The exact key covers the whole normalized prompt; the scope covers everything but the last question
+        normalized = [(message.get('role'), normalizeText(message.get('content', ''))) for message in messages]
+        question = normalized[-1][1] if normalized else ''
+        return {
+            'key': hashlib.sha256(json.dumps([model, fingerprint, normalized]).encode('utf-8')).hexdigest(),
+            'scope': hashlib.sha256(json.dumps([model, fingerprint, normalized[:-1]]).encode('utf-8')).hexdigest(),
+            'question': question,
+            'embedding': None,
+        }
+
+    def semanticEnabled(self):
+        return self.similarity_threshold is not None
+
+    def get(self, request):
+        now = time.time()
+        oldest_valid = now - self.ttl_seconds
+
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT key, response FROM entries WHERE key = ? AND created >= ?", (request['key'], oldest_valid)
+            ).fetchone()
+            if row:
+                self.recordHit(row[0], now, 'exact_hits')
+                return json.loads(row[1])
+
+        # Fall back to the closest question asked in the same context; the caller embeds the question beforehand
+        if self.semanticEnabled() and request['embedding'] is not None:
+            with self.lock:
+                candidates = self.connection.execute(
+                    "SELECT key, response, embedding FROM entries WHERE scope = ? AND embedding IS NOT NULL AND created >= ?",
+                    (request['scope'], oldest_valid)
+                ).fetchall()
+                best_key, best_response, best_similarity = None, None, self.similarity_threshold
+                for key, response, embedding in candidates:
+                    similarity = cosineSimilarity(request['embedding'], json.loads(embedding))
+                    if similarity >= best_similarity:
+                        best_key, best_response, best_similarity = key, response, similarity
+                if best_key:
+                    self.recordHit(best_key, now, 'semantic_hits')
+                    return json.loads(best_response)
+
+        with self.lock, self.connection:
+            self.incrementStat('misses')
+        return None
+
+    def put(self, request, response):
+        now = time.time()
+        embedding = json.dumps(request['embedding']) if request['embedding'] is not None else None
+
+        with self.lock, self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO entries (key, scope, response, embedding, created, last_access, hits) VALUES (?, ?, ?, ?, ?, ?, 0)",
+                (request['key'], request['scope'], json.dumps(response), embedding, now, now)
+            )
+
+            # Drop expired entries, then the least recently used ones beyond the size limit
+            self.connection.execute("DELETE FROM entries WHERE created < ?", (now - self.ttl_seconds,))
+            self.connection.execute(
+                "DELETE FROM entries WHERE key IN (SELECT key FROM entries ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            )
+
+    def recordHit(self, key, now, stat_name):
+        # Callers hold the lock
+        with self.connection:
+            self.connection.execute("UPDATE entries SET last_access = ?, hits = hits + 1 WHERE key = ?", (now, key))
+            self.incrementStat(stat_name)
+
+    def incrementStat(self, stat_name):
+        self.connection.execute(
+            "INSERT INTO stats (name, value) VALUES (?, 1) ON CONFLICT(name) DO UPDATE SET value = value + 1", (stat_name,)
+        )
+
+    def stats(self):
+        # Hit/miss counters plus the current number of entries
+        with self.lock:
+            counters = dict(self.connection.execute("SELECT name, value FROM stats").fetchall())
+            counters['entries'] = self.connection.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        for name in ('exact_hits', 'semantic_hits', 'misses'):
+            counters.setdefault(name, 0)
+        return counters
+
+    def close(self):
+        self.connection.close()
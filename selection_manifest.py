@@ -0,0 +1,73 @@
+from datetime import datetime
+import json
+import os
+import shutil
+
+# The selection is a small manifest of document ids; the documents themselves stay where they were uploaded
+SELECTION_MANIFEST_FILE = 'selection.json'
+SELECTION_MANIFEST_VERSION = 1
+
+# Folder the selected documents used to be copied into before the manifest existed
+LEGACY_SELECTED_FILES_FOLDER = 'selected_files'
+
+
+def selectionManifestPath(data_store_directory):
+    return os.path.join(data_store_directory, SELECTION_MANIFEST_FILE)
+
+
+def readSelectionManifest(data_store_directory):
+    # Return the ids (file names in the data storage folder) of the selected documents
+    manifest_path = selectionManifestPath(data_store_directory)
+    if not os.path.exists(manifest_path):
+        return []
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as file:
+            return list(json.load(file).get('documents', []))
+    except (OSError, ValueError, AttributeError) as e:
+        print(f"Failed to read selection manifest {manifest_path}: {e}")
+        return []
+
+
+def writeSelectionManifest(data_store_directory, document_ids):
+    manifest = {
+        "version": SELECTION_MANIFEST_VERSION,
+        "updated": datetime.now().isoformat(),
+        "documents": sorted(set(document_ids)),
+    }
+
+    # Write to a temporary file and move it into place so readers never see a partial manifest
+    os.makedirs(data_store_directory, exist_ok=True)
+    manifest_path = selectionManifestPath(data_store_directory)
+    temp_path = f'{manifest_path}.tmp'
+    with open(temp_path, 'w', encoding='utf-8') as file:
+        json.dump(manifest, file, indent=4)
+    os.replace(temp_path, manifest_path)
+
+
+def selectedDocumentPaths(data_store_directory, document_ids):
+    # Resolve ids to the canonical documents, ignoring any that were removed since they were selected
+    document_paths = (os.path.join(data_store_directory, document_id) for document_id in document_ids)
+    return [document_path for document_path in document_paths if os.path.isfile(document_path)]
+
+
+def migrateLegacySelection(data_store_directory):
+    # Convert a selected_files folder of copies into a manifest, keeping the documents it selected
+    legacy_directory = os.path.join(data_store_directory, LEGACY_SELECTED_FILES_FOLDER)
+    if not os.path.isdir(legacy_directory):
+        return
+
+    if not os.path.exists(selectionManifestPath(data_store_directory)):
+        document_ids = []
+        for filename in os.listdir(legacy_directory):
+            legacy_path = os.path.join(legacy_directory, filename)
+            if filename.endswith('.json') or not os.path.isfile(legacy_path):
+                continue
+
+            # A copy whose original was deleted becomes the canonical document again
+            if not os.path.exists(os.path.join(data_store_directory, filename)):
+                shutil.move(legacy_path, os.path.join(data_store_directory, filename))
+            document_ids.append(filename)
+        writeSelectionManifest(data_store_directory, document_ids)
+
+    # The copies and the filtered descriptions are no longer used
+    shutil.rmtree(legacy_directory, ignore_errors=True)
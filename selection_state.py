@@ -0,0 +1,74 @@
+import os
+import threading
+
+from PySide6.QtCore import QObject, QFileSystemWatcher, Signal
+
+from util.selection_manifest import readSelectionManifest, selectedDocumentPaths, selectionManifestPath
+
+
+class SelectionState(QObject):
+    """The SelectionState class keeps the profile's selected documents and their descriptions in memory. It is loaded from the selection manifest and the document store on first use and marked stale by a QFileSystemWatcher on the data storage folder and the selected documents, or explicitly when the selection is finalized or a document is ingested, so routing a query does not touch the disk while nothing has changed."""
+    watch_paths_requested = Signal(list)
+
+    def __init__(self, data_store_directory, document_store, parent=None):
+        super().__init__(parent)
+        self.data_store_directory = data_store_directory
+        self.document_store = document_store  # Source of the documents' descriptions
+        self.document_paths = []  # Full paths of the selected documents, in name order
+        self.descriptions = {}  # Document descriptions keyed by file name without extension
+        self.stale = True  # Reload from disk on next access
+
+        # Queries read the state from worker threads while the watcher marks it stale on the UI thread
+        self.lock = threading.Lock()
+
+        self.watcher = QFileSystemWatcher(self)
+        self.watcher.directoryChanged.connect(self.invalidate)
+        self.watcher.fileChanged.connect(self.invalidate)
+
+        # State may be reloaded on a worker thread, but the watcher is only updated from the thread that owns it
+        self.watch_paths_requested.connect(self.watchPaths)
+
+    def invalidate(self, path=None):
+        with self.lock:
+            self.stale = True
+
+    def refresh(self):
+        # Callers hold the lock
+        if not self.stale:
+            return
+
+        self.document_paths = []
+        self.descriptions = {}
+        if os.path.isdir(self.data_store_directory):
+            # The manifest names the selected documents, which are read where they were uploaded
+            self.document_paths = sorted(selectedDocumentPaths(self.data_store_directory, readSelectionManifest(self.data_store_directory)))
+
+            # Look up only the selected documents' descriptions, keyed by file name without extension
+            records = self.document_store.getDocuments(os.path.basename(document_path) for document_path in self.document_paths)
+            self.descriptions = {
+                os.path.splitext(document_id)[0]: record['description']
+                for document_id, record in records.items() if record['description']
+            }
+
+            # Watch the folder for a rewritten manifest and the selected documents for changes
+            watched_paths = [self.data_store_directory, selectionManifestPath(self.data_store_directory), *self.document_paths]
+            self.watch_paths_requested.emit(watched_paths)
+
+        self.stale = False
+
+    def watchPaths(self, paths):
+        # Paths already watched, or removed since the request, are skipped
+        watched = set(self.watcher.files()) | set(self.watcher.directories())
+        if new_paths := [path for path in paths if path not in watched and os.path.exists(path)]:
+            self.watcher.addPaths(new_paths)
+
+    def hasDocuments(self):
+        with self.lock:
+            self.refresh()
+            return bool(self.document_paths)
+
+    def selectedDocuments(self):
+        # Snapshot of the selected document paths and their descriptions
+        with self.lock:
+            self.refresh()
+            return list(self.document_paths), dict(self.descriptions)
@@ -0,0 +1,152 @@
+import os
+import sqlite3
+import time
+
+from util.session_store import isSessionFile, readSessionMessages, resolveSessionPath, sessionNameFromFile
+
+
+class SessionCatalog:
+    """The SessionCatalog class keeps a per-profile SQLite index of chat sessions: id, title, created/updated timestamps, message count and file size. The history sidebar reads its ordering from the catalog instead of listing the chat_history directory, and sessions are renamed by changing their title rather than their file. Every message is also kept in an FTS5 full-text index, updated as messages are written, so all sessions of a profile can be searched at once."""
+    def __init__(self, db_path, history_dir):
+        self.history_dir = history_dir
+        self.connection = sqlite3.connect(db_path)
+        with self.connection:
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS sessions ("
+                "session_id TEXT PRIMARY KEY, title TEXT NOT NULL, created REAL NOT NULL, updated REAL NOT NULL, "
+                "message_count INTEGER NOT NULL DEFAULT 0, size INTEGER NOT NULL DEFAULT 0)"
+            )
+            self.connection.execute("CREATE INDEX IF NOT EXISTS sessions_updated ON sessions (updated)")
+
+        # Full-text search needs SQLite built with FTS5; without it the rest of the catalog still works
+        try:
+            with self.connection:
+                self.connection.execute(
+                    "CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5("
+                    "content, role UNINDEXED, session_id UNINDEXED, position UNINDEXED)"
+                )
+            self.search_enabled = True
+        except sqlite3.OperationalError as e:
+            print(f"Full-text search is unavailable: {e}")
+            self.search_enabled = False
+
+        # Catalogs created before the search index existed have their sessions indexed once
+        if self.search_enabled and self.connection.execute("PRAGMA user_version").fetchone()[0] < 1:
+            self.indexExistingSessions()
+
+    def syncWithDirectory(self):
+        # Reconcile the catalog with the session files on disk, e.g. sessions created before the catalog existed
+        session_files = {sessionNameFromFile(file): file for file in os.listdir(self.history_dir) if isSessionFile(file)}
+        known_ids = {row[0] for row in self.connection.execute("SELECT session_id FROM sessions")}
+
+        with self.connection:
+            for session_id in session_files.keys() - known_ids:
+                session_path = os.path.join(self.history_dir, session_files[session_id])
+                stat = os.stat(session_path)
+                try:
+                    messages = readSessionMessages(session_path)
+                except Exception as e:
+                    print(f"Failed to read session {session_path}: {e}")
+                    messages = []
+                self.connection.execute(
+                    "INSERT INTO sessions (session_id, title, created, updated, message_count, size) VALUES (?, ?, ?, ?, ?, ?)",
+                    (session_id, session_id, stat.st_mtime, stat.st_mtime, len(messages), stat.st_size)
+                )
+                self.indexMessages(session_id, 0, messages)
+
+            # Forget sessions whose files were removed outside the application
+            for session_id in known_ids - session_files.keys():
+                self.removeSession(session_id)
+
+    def indexExistingSessions(self):
+        # Build the search index for every session already in the catalog
+        with self.connection:
+            self.connection.execute("DELETE FROM messages_fts")
+            for (session_id,) in self.connection.execute("SELECT session_id FROM sessions").fetchall():
+                try:
+                    messages = readSessionMessages(self.sessionPath(session_id))
+                except Exception as e:
+                    print(f"Failed to index session {session_id}: {e}")
+                    continue
+                self.indexMessages(session_id, 0, messages)
+            self.connection.execute("PRAGMA user_version = 1")
+
+    def indexMessages(self, session_id, first_position, messages):
+        # Callers wrap this in a transaction; positions match the message's place in the session file
+        if not self.search_enabled:
+            return
+        self.connection.executemany(
+            "INSERT INTO messages_fts (content, role, session_id, position) VALUES (?, ?, ?, ?)",
+            [
+                (message.get('content', ''), message.get('role', ''), session_id, first_position + offset)
+                for offset, message in enumerate(messages)
+            ]
+        )
+
+    def removeSession(self, session_id):
+        # Callers wrap this in a transaction
+        self.connection.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+        if self.search_enabled:
+            self.connection.execute("DELETE FROM messages_fts WHERE session_id = ?", (session_id,))
+
+    def listSessions(self):
+        # Most recently updated sessions first
+        return self.connection.execute("SELECT session_id, title FROM sessions ORDER BY updated DESC").fetchall()
+
+    def sessionTitle(self, session_id):
+        row = self.connection.execute("SELECT title FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+        return row[0] if row else None
+
+    def titleExists(self, title):
+        return self.connection.execute("SELECT 1 FROM sessions WHERE title = ?", (title,)).fetchone() is not None
+
+    def sessionPath(self, session_id):
+        return resolveSessionPath(self.history_dir, session_id)
+
+    def addSession(self, session_id, title=None):
+        now = time.time()
+        with self.connection:
+            self.connection.execute(
+                "INSERT OR IGNORE INTO sessions (session_id, title, created, updated) VALUES (?, ?, ?, ?)",
+                (session_id, title or session_id, now, now)
+            )
+
+    def recordMessages(self, session_id, messages, size):
+        # Register the session if this is its first write, then index the new messages and bump its counters and recency
+        self.addSession(session_id)
+        with self.connection:
+            first_position = self.connection.execute(
+                "SELECT message_count FROM sessions WHERE session_id = ?", (session_id,)
+            ).fetchone()[0]
+            self.indexMessages(session_id, first_position, messages)
+            self.connection.execute(
+                "UPDATE sessions SET updated = ?, message_count = message_count + ?, size = ? WHERE session_id = ?",
+                (time.time(), len(messages), size, session_id)
+            )
+
+    def renameSession(self, session_id, title):
+        with self.connection:
+            self.connection.execute("UPDATE sessions SET title = ? WHERE session_id = ?", (title, session_id))
+
+    def deleteSession(self, session_id):
+        with self.connection:
+            self.removeSession(session_id)
+
+    def searchMessages(self, text, limit=50):
+        # Match every word, treating the last one as a prefix so results update while typing
+        terms = ['"{}"'.format(term.replace('"', '""')) for term in text.split()]
+        if not terms or not self.search_enabled:
+            return []
+        terms[-1] += '*'
+
+        # Best matches first, with a highlighted snippet and the message's position in its session
+        return self.connection.execute(
+            "SELECT messages_fts.session_id, sessions.title, messages_fts.position, messages_fts.role, "
+            "snippet(messages_fts, 0, '[', ']', '...', 12) "
+            "FROM messages_fts JOIN sessions ON sessions.session_id = messages_fts.session_id "
+            "WHERE messages_fts MATCH ? ORDER BY bm25(messages_fts) LIMIT ?",
+            (' '.join(terms), limit)
+        ).fetchall()
+
+    def close(self):
+        self.connection.close()
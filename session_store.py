@@ -0,0 +1,160 @@
+from datetime import datetime
+import json
+import os
+
+# Sessions are stored as JSON Lines: a header record followed by one record per message
+SESSION_EXTENSION = '.jsonl'
+LEGACY_SESSION_EXTENSION = '.json'
+SESSION_FORMAT_VERSION = 1
+
+
+def isSessionFile(filename):
+    # Accept both the append-only format and legacy JSON array sessions
+    return filename.endswith(SESSION_EXTENSION) or filename.endswith(LEGACY_SESSION_EXTENSION)
+
+
+def sessionNameFromFile(filename):
+    # Strip the session extension to get the name shown to the user
+    return os.path.splitext(os.path.basename(filename))[0]
+
+
+def resolveSessionPath(history_dir, session_name):
+    # Prefer the append-only file, falling back to a legacy session that has not been migrated yet
+    session_path = os.path.join(history_dir, f'{session_name}{SESSION_EXTENSION}')
+    legacy_path = os.path.join(history_dir, f'{session_name}{LEGACY_SESSION_EXTENSION}')
+    if not os.path.exists(session_path) and os.path.exists(legacy_path):
+        return legacy_path
+    return session_path
+
+
+def createSessionFile(session_file_path):
+    # Write the header record that identifies the file as an append-only session
+    header = {"type": "header", "version": SESSION_FORMAT_VERSION, "created": datetime.now().isoformat()}
+    with open(session_file_path, 'w', encoding='utf-8') as file:
+        file.write(json.dumps(header, ensure_ascii=False) + '\n')
+
+
+def appendSessionRecords(session_file_path, records):
+    # Create the file with its header the first time a record is written
+    if not os.path.exists(session_file_path):
+        createSessionFile(session_file_path)
+
+    # Each record is a single line, so persisting a message never rewrites earlier ones
+    with open(session_file_path, 'a', encoding='utf-8') as file:
+        file.writelines(json.dumps(record, ensure_ascii=False) + '\n' for record in records)
+
+
+def readSessionRecords(session_file_path):
+    # Legacy sessions are a single JSON array of messages
+    if session_file_path.endswith(LEGACY_SESSION_EXTENSION):
+        with open(session_file_path, 'r', encoding='utf-8') as file:
+            content = file.read().strip()
+        return json.loads(content) if content else []
+
+    records = []
+    with open(session_file_path, 'r', encoding='utf-8') as file:
+        for line in file:
+            if not line.strip():
+                continue
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError:
+                # A partially written last line (e.g. after a crash) is skipped rather than losing the session
+                print(f"Skipping corrupt record in session file: {session_file_path}")
+    return records
+
+
+def readSessionMessages(session_file_path):
+    # Keep only message records, dropping the header and any other bookkeeping records
+    return [record for record in readSessionRecords(session_file_path) if 'type' not in record]
+
+
+def readSessionHistory(session_file_path):
+    # Return the session's messages together with its latest rolling summary record, if any
+    messages = []
+    summary = None
+    for record in readSessionRecords(session_file_path):
+        if 'type' not in record:
+            messages.append(record)
+        elif record['type'] == 'summary':
+            summary = record
+    return messages, summary
+
+
+def migrateLegacySession(legacy_file_path):
+    # Nothing to do for files that are already in the append-only format
+    if not legacy_file_path.endswith(LEGACY_SESSION_EXTENSION):
+        return legacy_file_path
+
+    session_file_path = f'{os.path.splitext(legacy_file_path)[0]}{SESSION_EXTENSION}'
+
+    # Convert into a temporary file first so an interrupted migration never loses messages
+    # A legacy file that fails to parse raises and is left in place, so its messages are never lost
+    try:
+        messages = readSessionRecords(legacy_file_path)
+    except FileNotFoundError:
+        messages = []
+    temp_file_path = f'{session_file_path}.tmp'
+    createSessionFile(temp_file_path)
+    appendSessionRecords(temp_file_path, messages)
+    os.replace(temp_file_path, session_file_path)
+
+    # Remove the legacy file once the converted session is in place
+    if os.path.exists(legacy_file_path):
+        os.remove(legacy_file_path)
+
+    return session_file_path
+
+
+class SessionPager:
+    """The SessionPager class pages through an append-only session file from the newest message backwards. It only keeps the byte offset of each message record in memory and reads a page of records from disk when it is requested."""
+    def __init__(self, session_file_path, page_size=50):
+        self.session_file_path = session_file_path
+        self.page_size = page_size
+
+        # Byte offset of every message record, in session order
+        self.record_offsets = self.indexRecordOffsets()
+
+        # Position of the oldest message handed out so far; everything before it is still on disk
+        self.first_loaded_position = len(self.record_offsets)
+
+    def indexRecordOffsets(self):
+        offsets = []
+        offset = 0
+        with open(self.session_file_path, 'rb') as file:
+            for line in file:
+                # Header and bookkeeping records start with their "type" key and are not messages
+                if line.strip() and not line.startswith(b'{"type"'):
+                    offsets.append(offset)
+                offset += len(line)
+        return offsets
+
+    def messageCount(self):
+        return len(self.record_offsets)
+
+    def hasPreviousPage(self):
+        return self.first_loaded_position > 0
+
+    def previousPage(self):
+        # Work out which records make up the page just before what is already loaded
+        end = self.first_loaded_position
+        start = max(0, end - self.page_size)
+        if start == end:
+            return []
+
+        messages = []
+        with open(self.session_file_path, 'rb') as file:
+            # Jump straight to each message record; bookkeeping records in between are never read
+            for offset in self.record_offsets[start:end]:
+                file.seek(offset)
+                line = file.readline()
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    print(f"Skipping corrupt record in session file: {self.session_file_path}")
+                    continue
+                if 'type' not in record:
+                    messages.append(record)
+
+        self.first_loaded_position = start
+        return messages
@@ -0,0 +1,132 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+# Modules the login screen should never need; any of these loaded before login is a startup regression
+HEAVY_MODULES = ['llama_index', 'guidance', 'fitz', 'pytesseract', 'PIL', 'httpx', 'tiktoken', 'openai', 'numpy']
+
+# Imported in a fresh interpreter: everything main.py needs to reach the login dialog
+STARTUP_IMPORT = 'import main'
+
+# Shows the login dialog offscreen and reports how long it took from interpreter start
+LOGIN_PROBE = """
+import time
+start = time.perf_counter()
+from PySide6.QtWidgets import QApplication
+import main
+from login_win import login_interface
+app = QApplication([])
+window = login_interface.LoginWindow()
+window.show()
+app.processEvents()
+print(time.perf_counter() - start)
+"""
+
+
+def runPython(code, extra_args=(), env=None):
+    return subprocess.run(
+        [sys.executable, *extra_args, '-c', code],
+        capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)), env=env
+    )
+
+
+def parseImportTime(stderr):
+    # Lines look like "import time:   self [us] | cumulative | imported package"
+    modules = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|', 2)
+        modules.append({
+            'module': name.strip(),
+            'self_us': int(self_us),
+            'cumulative_us': int(cumulative_us),
+            'depth': (len(name) - len(name.lstrip()) - 1) // 2,
+        })
+    return modules
+
+
+def importTimeReport(top):
+    result = runPython(STARTUP_IMPORT, extra_args=('-X', 'importtime'))
+    if result.returncode != 0:
+        raise RuntimeError(f"Importing main failed:\n{result.stderr}")
+    modules = parseImportTime(result.stderr)
+
+    # Top-level packages are summed so a package's submodules are reported as one entry
+    packages = {}
+    for module in modules:
+        package = module['module'].split('.')[0]
+        packages[package] = packages.get(package, 0) + module['self_us']
+
+    loaded = {module['module'] for module in modules}
+    return {
+        'total_ms': sum(module['self_us'] for module in modules) / 1000,
+        'module_count': len(modules),
+        'slowest_modules': sorted(modules, key=lambda module: module['cumulative_us'], reverse=True)[:top],
+        'slowest_packages': [
+            {'package': package, 'self_ms': self_us / 1000}
+            for package, self_us in sorted(packages.items(), key=lambda item: item[1], reverse=True)[:top]
+        ],
+        'heavy_modules_loaded': [name for name in HEAVY_MODULES if name in loaded],
+    }
+
+
+def loginTimings(runs):
+    # The offscreen platform lets the dialog be created without a display
+    env = dict(os.environ, QT_QPA_PLATFORM='offscreen')
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = runPython(LOGIN_PROBE, env=env)
+        wall_time = time.perf_counter() - start
+        if result.returncode != 0:
+            raise RuntimeError(f"Showing the login window failed:\n{result.stderr}")
+        timings.append({'in_process_ms': float(result.stdout.strip().splitlines()[-1]) * 1000, 'wall_ms': wall_time * 1000})
+    return timings
+
+
+def summarize(values):
+    return {
+        'min': min(values),
+        'median': statistics.median(values),
+        'max': max(values),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure how long the application takes to reach the login window.")
+    parser.add_argument('--runs', type=int, default=5, help="Cold starts to time")
+    parser.add_argument('--top', type=int, default=15, help="Slowest modules and packages to report")
+    parser.add_argument('--output', default='startup_benchmark.json', help="Where to write the JSON report")
+    args = parser.parse_args()
+
+    imports = importTimeReport(args.top)
+    timings = loginTimings(args.runs)
+    report = {
+        'python': sys.version.split()[0],
+        'runs': args.runs,
+        'login_window_ms': {
+            'in_process': summarize([timing['in_process_ms'] for timing in timings]),
+            'wall': summarize([timing['wall_ms'] for timing in timings]),
+        },
+        'imports': imports,
+    }
+
+    with open(args.output, 'w') as file:
+        json.dump(report, file, indent=4)
+
+    print(f"Login window shown in {report['login_window_ms']['wall']['median']:.0f} ms (median wall time over {args.runs} runs)")
+    print(f"Imports before login: {imports['module_count']} modules, {imports['total_ms']:.0f} ms")
+    for package in imports['slowest_packages']:
+        print(f"  {package['package']:<30} {package['self_ms']:8.1f} ms")
+    if imports['heavy_modules_loaded']:
+        print(f"Heavy modules loaded before login: {', '.join(imports['heavy_modules_loaded'])}")
+    print(f"Report written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,200 @@
+import argparse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import hashlib
+import json
+import random
+import threading
+import time
+
+
+class StubConfig:
+    """The StubConfig class holds the behaviour of the stub server: response latency and jitter, the delay between streamed tokens, the share of requests answered with a server error or a 429, and the Retry-After sent with a 429."""
+    def __init__(self, latency=0.2, jitter=0.05, token_delay=0.01, error_rate=0.0, rate_limit_rate=0.0, retry_after=1.0, response_words=60, embedding_dimensions=256, seed=None):
+        self.latency = latency  # Seconds before the response (or its first streamed token) is sent
+        self.jitter = jitter  # Random extra seconds added to the latency
+        self.token_delay = token_delay  # Seconds between streamed tokens
+        self.error_rate = error_rate  # Share of requests answered with a 500
+        self.rate_limit_rate = rate_limit_rate  # Share of requests answered with a 429
+        self.retry_after = retry_after  # Retry-After seconds sent with a 429; None sends no header
+        self.response_words = response_words  # Words in each generated answer
+        self.embedding_dimensions = embedding_dimensions
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()  # Requests are served on several threads
+
+        # Requests served, by outcome
+        self.counters = {'requests': 0, 'completions': 0, 'streams': 0, 'embeddings': 0, 'errors': 0, 'rate_limited': 0}
+
+    def count(self, name):
+        with self.lock:
+            self.counters[name] += 1
+
+    def roll(self):
+        # Decide the outcome of one request
+        with self.lock:
+            value = self.random.random()
+            delay = self.latency + self.random.uniform(0, self.jitter)
+        if value < self.rate_limit_rate:
+            return 'rate_limited', delay
+        if value < self.rate_limit_rate + self.error_rate:
+            return 'error', delay
+        return 'ok', delay
+
+
+def answerFor(messages, word_count):
+    # A deterministic answer that echoes part of the last message, so repeated prompts get the same text
+    prompt = str(messages[-1].get('content', '')) if messages else ''
+    seed_words = prompt.split() or ['stub']
+    return ' '.join(seed_words[position % len(seed_words)] for position in range(word_count))
+
+
+def embeddingFor(text, dimensions):
+    # Similar texts do not get similar vectors, but the same text always gets the same one
+    digest = hashlib.sha256(text.encode('utf-8')).digest()
+    return [(digest[position % len(digest)] - 128) / 128 for position in range(dimensions)]
+
+
+class StubRequestHandler(BaseHTTPRequestHandler):
+    """The StubRequestHandler class answers OpenAI-style /v1/chat/completions (plain and streamed) and /v1/embeddings requests according to the server's StubConfig."""
+    protocol_version = 'HTTP/1.1'  # Keep connections alive like the real API
+
+    def log_message(self, format, *args):
+        # Load tests send thousands of requests; keep the console quiet
+        pass
+
+    def do_POST(self):
+        config = self.server.config
+        config.count('requests')
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)) or 0)
+        try:
+            payload = json.loads(body or b'{}')
+        except json.JSONDecodeError:
+            self.sendJson(400, {'error': {'message': 'Invalid JSON body', 'type': 'invalid_request_error'}})
+            return
+
+        outcome, delay = config.roll()
+        time.sleep(delay)
+        if outcome == 'rate_limited':
+            config.count('rate_limited')
+            headers = {'Retry-After': str(config.retry_after)} if config.retry_after is not None else {}
+            self.sendJson(429, {'error': {'message': 'Rate limit reached', 'type': 'rate_limit_error'}}, headers)
+            return
+        if outcome == 'error':
+            config.count('errors')
+            self.sendJson(500, {'error': {'message': 'Stub server error', 'type': 'server_error'}})
+            return
+
+        if self.path.endswith('/chat/completions'):
+            self.chatCompletion(payload)
+        elif self.path.endswith('/embeddings'):
+            self.embeddings(payload)
+        else:
+            self.sendJson(404, {'error': {'message': f'Unknown endpoint {self.path}', 'type': 'invalid_request_error'}})
+
+    def chatCompletion(self, payload):
+        config = self.server.config
+        model = payload.get('model', 'stub-model')
+        content = answerFor(payload.get('messages', []), config.response_words)
+
+        if not payload.get('stream'):
+            config.count('completions')
+            self.sendJson(200, {
+                'id': 'chatcmpl-stub',
+                'object': 'chat.completion',
+                'created': int(time.time()),
+                'model': model,
+                'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': content}, 'finish_reason': 'stop'}],
+                'usage': {'prompt_tokens': 0, 'completion_tokens': len(content.split()), 'total_tokens': len(content.split())},
+            })
+            return
+
+        # Server-sent events, one word per chunk, closed with [DONE]; chunked encoding keeps the connection reusable
+        config.count('streams')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        for position, word in enumerate(content.split()):
+            chunk = {
+                'id': 'chatcmpl-stub',
+                'object': 'chat.completion.chunk',
+                'model': model,
+                'choices': [{'index': 0, 'delta': {'content': word if position == 0 else f' {word}'}, 'finish_reason': None}],
+            }
+            self.writeChunk(f"data: {json.dumps(chunk)}\n\n".encode('utf-8'))
+            time.sleep(config.token_delay)
+        self.writeChunk(b"data: [DONE]\n\n")
+
+        # A zero-length chunk ends the response
+        self.writeChunk(b'')
+
+    def writeChunk(self, data):
+        self.wfile.write(f"{len(data):X}\r\n".encode('ascii') + data + b"\r\n")
+        self.wfile.flush()
+
+    def embeddings(self, payload):
+        config = self.server.config
+        config.count('embeddings')
+        inputs = payload.get('input', '')
+        inputs = inputs if isinstance(inputs, list) else [inputs]
+        self.sendJson(200, {
+            'object': 'list',
+            'model': payload.get('model', 'stub-embedding'),
+            'data': [
+                {'object': 'embedding', 'index': index, 'embedding': embeddingFor(str(text), config.embedding_dimensions)}
+                for index, text in enumerate(inputs)
+            ],
+        })
+
+    def sendJson(self, status, body, headers=None):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def startStubServer(config=None, host='127.0.0.1', port=0):
+    # Serve on a background thread and return the server and its base URL; port 0 picks a free port
+    server = ThreadingHTTPServer((host, port), StubRequestHandler)
+    server.daemon_threads = True
+    server.config = config or StubConfig()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}/v1"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve a local OpenAI-compatible stub for chat completions and embeddings.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', type=float, default=0.2, help="Seconds before each response")
+    parser.add_argument('--jitter', type=float, default=0.05, help="Random extra seconds of latency")
+    parser.add_argument('--token-delay', type=float, default=0.01, help="Seconds between streamed tokens")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="Share of requests answered with a 500")
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0, help="Share of requests answered with a 429")
+    parser.add_argument('--retry-after', type=float, default=1.0, help="Retry-After seconds sent with a 429")
+    parser.add_argument('--response-words', type=int, default=60, help="Words in each answer")
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args()
+
+    config = StubConfig(
+        latency=args.latency, jitter=args.jitter, token_delay=args.token_delay, error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate, retry_after=args.retry_after, response_words=args.response_words, seed=args.seed
+    )
+    server = ThreadingHTTPServer((args.host, args.port), StubRequestHandler)
+    server.config = config
+    print(f"Stub OpenAI server listening on http://{args.host}:{args.port}/v1")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(json.dumps(config.counters, indent=4))
+
+
+if __name__ == "__main__":
+    main()
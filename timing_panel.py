@@ -0,0 +1,64 @@
+from datetime import datetime
+
+from PySide6.QtWidgets import QDialog, QVBoxLayout, QHBoxLayout, QTreeWidget, QTreeWidgetItem, QPushButton, QFileDialog, QMessageBox
+
+from util.tracing import MAX_RECENT_TRACES, exportChromeTrace, recentTraces
+
+
+class TimingPanel(QDialog):
+    """The TimingPanel class is a debug dialog listing the most recent chat requests with the time spent in each stage, and exporting them as a Chrome trace file."""
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Request Timings")
+        self.setGeometry(650, 300, 640, 420)
+        self.setupUI()
+        self.refresh()
+
+    def setupUI(self):
+        layout = QVBoxLayout(self)
+
+        # One row per request, expanded into one row per stage
+        self.traceTree = QTreeWidget()
+        self.traceTree.setHeaderLabels(["Request / stage", "Spans", "Time (ms)", "Share"])
+        self.traceTree.setColumnWidth(0, 320)
+        layout.addWidget(self.traceTree)
+
+        buttons = QHBoxLayout()
+        self.refreshButton = QPushButton("Refresh")
+        self.refreshButton.clicked.connect(self.refresh)
+        buttons.addWidget(self.refreshButton)
+
+        self.exportButton = QPushButton("Export Chrome Trace...")
+        self.exportButton.clicked.connect(self.exportTrace)
+        buttons.addWidget(self.exportButton)
+        layout.addLayout(buttons)
+
+    def refresh(self):
+        self.traceTree.clear()
+
+        # Newest requests first
+        for trace in reversed(recentTraces()):
+            started = datetime.fromtimestamp(trace.started).strftime("%H:%M:%S")
+            total = trace.finished
+            total_text = f"{total * 1000:.1f}" if total is not None else "running"
+            request_item = QTreeWidgetItem([f"{started}  {trace.label}", str(len(trace.spans)), total_text, ""])
+
+            for name, stage in trace.stageTotals().items():
+                share = f"{stage['duration'] / total:.0%}" if total else ""
+                request_item.addChild(QTreeWidgetItem([name, str(stage['count']), f"{stage['duration'] * 1000:.1f}", share]))
+            self.traceTree.addTopLevelItem(request_item)
+
+        # Show the latest request's breakdown straight away
+        if self.traceTree.topLevelItemCount():
+            self.traceTree.topLevelItem(0).setExpanded(True)
+
+    def exportTrace(self):
+        file_path, _ = QFileDialog.getSaveFileName(self, "Export Chrome Trace", "chat_trace.json", "Trace Files (*.json)")
+        if not file_path:
+            return
+        try:
+            request_count = exportChromeTrace(file_path)
+        except OSError as e:
+            QMessageBox.warning(self, "Export Failed", f"Could not write the trace: {e}")
+            return
+        QMessageBox.information(self, "Trace Exported", f"Exported the last {request_count} of up to {MAX_RECENT_TRACES} requests. Open the file in chrome://tracing or Perfetto.")
@@ -0,0 +1,128 @@
+from collections import deque
+from contextlib import contextmanager
+import contextvars
+import itertools
+import json
+import os
+import threading
+import time
+
+# Requests kept for the timing panel and trace export
+MAX_RECENT_TRACES = 50
+
+# Most recent traces, oldest first
+_recent_traces = deque(maxlen=MAX_RECENT_TRACES)
+_recent_traces_lock = threading.Lock()
+
+# The trace spans are recorded into; a context variable is separate per thread and per asyncio task
+_active_trace = contextvars.ContextVar('active_trace', default=None)
+
+_trace_ids = itertools.count(1)
+
+
+class Trace:
+    """The Trace class records the timing spans of one chat request as it moves from the UI thread to the event loop and back. Each span keeps its stage name, start, duration and thread, so a request can be broken down by stage or exported in Chrome trace format."""
+    def __init__(self, label):
+        self.trace_id = next(_trace_ids)
+        self.label = label
+        self.started = time.time()  # Wall-clock start, shown in the timing panel
+        self.start_counter = time.perf_counter()  # Spans are measured against this
+        self.finished = None  # Seconds from start to finish once the request completed
+        self.spans = []  # Dicts of name, start and duration in seconds, thread id and thread name
+
+    def addSpan(self, name, start_counter, end_counter):
+        thread = threading.current_thread()
+        self.spans.append({
+            'name': name,
+            'start': start_counter - self.start_counter,
+            'duration': end_counter - start_counter,
+            'thread_id': thread.ident,
+            'thread_name': thread.name,
+        })
+
+    def finish(self):
+        self.finished = time.perf_counter() - self.start_counter
+
+    def stageTotals(self):
+        # Total time and number of spans per stage, in the order stages first started
+        totals = {}
+        for span in sorted(self.spans, key=lambda span: span['start']):
+            total = totals.setdefault(span['name'], {'duration': 0.0, 'count': 0})
+            total['duration'] += span['duration']
+            total['count'] += 1
+        return totals
+
+
+def startTrace(label):
+    # Begin recording a request and keep it in the ring buffer of recent requests
+    trace = Trace(label)
+    with _recent_traces_lock:
+        _recent_traces.append(trace)
+    return trace
+
+
+def recentTraces():
+    with _recent_traces_lock:
+        return list(_recent_traces)
+
+
+def currentTrace():
+    return _active_trace.get()
+
+
+@contextmanager
+def activeTrace(trace):
+    # Record spans opened on this thread or task into the given trace, e.g. on the loop picking up a request
+    token = _active_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _active_trace.reset(token)
+
+
+@contextmanager
+def span(name):
+    # Time the enclosed block as one stage of the current request; does nothing outside a trace
+    trace = currentTrace()
+    if trace is None:
+        yield
+        return
+    start_counter = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.addSpan(name, start_counter, time.perf_counter())
+
+
+def chromeTraceEvents(traces):
+    # Complete ("X") events with microsecond timestamps, plus thread name metadata
+    process_id = os.getpid()
+    events = []
+    thread_names = {}
+    for trace in traces:
+        trace_start = trace.started * 1_000_000
+        for trace_span in trace.spans:
+            thread_names[trace_span['thread_id']] = trace_span['thread_name']
+            events.append({
+                'name': trace_span['name'],
+                'cat': 'chat',
+                'ph': 'X',
+                'ts': trace_start + trace_span['start'] * 1_000_000,
+                'dur': trace_span['duration'] * 1_000_000,
+                'pid': process_id,
+                'tid': trace_span['thread_id'],
+                'args': {'request': trace.trace_id, 'label': trace.label},
+            })
+    events.extend(
+        {'name': 'thread_name', 'ph': 'M', 'pid': process_id, 'tid': thread_id, 'args': {'name': thread_name}}
+        for thread_id, thread_name in thread_names.items()
+    )
+    return events
+
+
+def exportChromeTrace(path, traces=None):
+    # Write the traces (the recent ones by default) in a file chrome://tracing and Perfetto can open
+    traces = recentTraces() if traces is None else traces
+    with open(path, 'w', encoding='utf-8') as file:
+        json.dump({'traceEvents': chromeTraceEvents(traces), 'displayTimeUnit': 'ms'}, file)
+    return len(traces)